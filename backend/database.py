@@ -1,5 +1,11 @@
 import os
 import sqlite3
+import time
+import logging
+from pathlib import Path
+from urllib.parse import quote
+
+from metrics import observe, DB_CONNECT_SECONDS
 
 # Database path: use env var if set, otherwise resolve relative to this file
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -11,11 +17,43 @@ print(f"[DB] File exists: {os.path.exists(DATABASE_PATH)}")
 if os.path.exists(DATABASE_PATH):
     print(f"[DB] File size: {os.path.getsize(DATABASE_PATH)/1024/1024:.1f} MB")
 
-def get_db_connection():
-    """Establece una conexión a SpatiaLite asegurando WAL y extensión cargada."""
+# Modo de apertura: 'rw' (WAL, comportamiento histórico), 'ro' (solo lectura) o
+# 'immutable' (solo lectura sin locks ni chequeo de cambios: la DB no debe cambiar mientras corre el server)
+DB_MODE = os.environ.get('DB_MODE', 'rw').lower()
+DB_MMAP_SIZE = int(float(os.environ.get('DB_MMAP_SIZE_MB', '256')) * 1024 * 1024)
+DB_CACHE_SIZE_KB = int(float(os.environ.get('DB_CACHE_SIZE_MB', '64')) * 1024)
+# Calentamiento del page cache al iniciar: 'off', 'sync' o 'background'
+DB_WARMUP = os.environ.get('DB_WARMUP', 'background').lower()
+DB_WARMUP_LAYERS = [l for l in os.environ.get(
+    'DB_WARMUP_LAYERS', 'concesiones_mineras_const,concesiones_mineras_tramite,regiones,provincias,comunas').split(',') if l]
+# Lectura secuencial del archivo completo tras el warm-up dirigido (opt-in: si la DB no cabe en memoria
+# desaloja lo recién precargado, y corre en cada worker)
+DB_WARMUP_FULL = os.environ.get('DB_WARMUP_FULL', '0') == '1'
+print(f"[DB] Mode: {DB_MODE} (mmap {DB_MMAP_SIZE // (1024 * 1024)} MB, cache {DB_CACHE_SIZE_KB // 1024} MB)")
+
+# GDAL (gpd.read_file) abre la DB por su cuenta: le pasamos los mismos pragmas
+os.environ.setdefault('OGR_SQLITE_PRAGMA', f"mmap_size={DB_MMAP_SIZE},cache_size=-{DB_CACHE_SIZE_KB}")
+
+def _database_uri(db_path):
+    uri = f"file:{quote(Path(db_path).as_posix(), safe='/:')}"
+    if DB_MODE == 'immutable':
+        return uri + "?mode=ro&immutable=1"
+    if DB_MODE == 'ro':
+        return uri + "?mode=ro"
+    return uri
+
+def get_db_connection(db_path=None):
+    """
+    Abre una conexión a SpatiaLite (por defecto a la DB principal) según DB_MODE: WAL solo en modo 'rw';
+    en 'ro'/'immutable' se abre vía URI de solo lectura. Siempre con extensión, mmap y cache configurados.
+    """
+    with observe(DB_CONNECT_SECONDS):
+        return _open_connection(db_path or DATABASE_PATH)
+
+def _open_connection(db_path):
     # check_same_thread=False en sqlite3 permite usar la conexión en async context,
     # aunque con FastAPI y operaciones read-only concurrentes es seguro.
-    conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False)
+    conn = sqlite3.connect(_database_uri(db_path), uri=True, check_same_thread=False)
     
     # Habilitamos carga de extensiones
     conn.enable_load_extension(True)
@@ -64,10 +102,49 @@ def get_db_connection():
     if not loaded:
         print(f"CRITICAL DB WARNING: No se pudo cargar mod_spatialite. Las consultas ST_* fallarán.")
             
-    # Configuración WAL para permitir lecturas no bloqueantes mientras DucksDB/ETL pueda estar escribiendo
-    # y optimizar concurrencia en web
-    conn.execute('PRAGMA journal_mode=WAL;')
+    if DB_MODE == 'rw':
+        # Configuración WAL para permitir lecturas no bloqueantes mientras DucksDB/ETL pueda estar escribiendo
+        # y optimizar concurrencia en web
+        conn.execute('PRAGMA journal_mode=WAL;')
+
+    # mmap: las páginas se leen del page cache del SO, compartido entre procesos worker
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE};')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB};')
     
     # Retornemos diccionario en lugar de tupla para los registros
     conn.row_factory = sqlite3.Row
     return conn
+
+def warm_page_cache():
+    """
+    Precarga en el page cache del SO los índices R-Tree y las capas más consultadas (y el archivo
+    completo con DB_WARMUP_FULL=1), para que los primeros requests tras un deploy no esperen I/O de disco.
+    """
+    if not os.path.exists(DATABASE_PATH):
+        return
+    start = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'idx_%_node'")
+        rtree_tables = [row[0] for row in cursor.fetchall()]
+        for table in rtree_tables:
+            # substr(..., -1) obliga a leer el blob completo (length() solo lee el header del registro)
+            cursor.execute(f'SELECT SUM(length(substr(data, -1))) FROM "{table}"')
+        for layer in DB_WARMUP_LAYERS:
+            try:
+                cursor.execute(f'SELECT SUM(length(substr(GEOMETRY, -1))) FROM "{layer}"')
+            except sqlite3.OperationalError as e:
+                logging.warning(f"[DB] Warm-up: capa {layer} omitida ({e})")
+    finally:
+        conn.close()
+
+    if DB_WARMUP_FULL:
+        # Lectura secuencial del archivo completo (barata si ya está en cache)
+        with open(DATABASE_PATH, 'rb') as f:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            while f.read(8 * 1024 * 1024):
+                pass
+    logging.info(f"[DB] Page cache precargado ({len(rtree_tables)} R-Tree, {len(DB_WARMUP_LAYERS)} capas"
+                 f"{', archivo completo' if DB_WARMUP_FULL else ''}) en {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,12 @@
+def import_geo():
+    """
+    Import diferido de geopandas/fiona (pesan segundos al importar). Se llama en cada uso;
+    tras la primera vez es solo una búsqueda en sys.modules.
+    """
+    import geopandas as gpd
+    import fiona
+
+    # Habilitar soporte para KML en fiona (GeoPandas lo utiliza internamente)
+    fiona.drvsupport.supported_drivers['KML'] = 'rw'
+    fiona.drvsupport.supported_drivers['LIBKML'] = 'rw'
+    return gpd
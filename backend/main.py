@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Dict, Any, List
 import json
@@ -6,30 +7,87 @@ import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from shapely.geometry import shape
 from shapely import wkt
-import geopandas as gpd
-import pandas as pd
-import tempfile
+import shapely
+from functools import lru_cache
 import os
-import shutil
-import fiona
-
-# Habilitar soporte para KML en fiona (GeoPandas lo utiliza internamente)
-fiona.drvsupport.supported_drivers['KML'] = 'rw'
-fiona.drvsupport.supported_drivers['LIBKML'] = 'rw'
+import threading
 
 # Configurar logs
 import logging
 logging.basicConfig(level=logging.INFO)
 
 # Importar configuración de BD
-from database import get_db_connection, DATABASE_PATH
+from database import get_db_connection, warm_page_cache, DATABASE_PATH, DB_WARMUP
+from schema import decode_dataframe, decode_record, get_etl_metadata, count_tables
+from geo import import_geo
+from tiles import TILE_LAYERS, build_tile, build_tile_from_shards, tile_bounds, simplify_tolerance
+import profiling
+from shards import load_shards, shards_for_bbox, mercator_y_to_lat, query_remote, merge_shard_results
+from responses import dumps, json_response, encode_response, stream_response, range_file_response, TileCache, tile_response
+from uploads import MAX_UPLOAD_BYTES, UploadTooLarge, receive_upload, parse_upload
+import time
+from metrics import (observe, render_metrics, LAYER_QUERY_SECONDS, AREA_SECONDS, TILE_SECONDS, UPLOAD_PARSE_SECONDS,
+                     EXECUTOR_QUEUE_WAIT_SECONDS, EXECUTOR_ACTIVE, CACHE_REQUESTS, REQUEST_SECONDS, RESPONSE_BYTES)
 
 app = FastAPI(title="Geoportal Chile API", version="1.0.0")
 
+@app.on_event("startup")
+async def warm_imports():
+    """geopandas/fiona se importan en segundo plano: el servidor acepta requests de inmediato."""
+    threading.Thread(target=import_geo, name="warm-imports", daemon=True).start()
+
+@app.on_event("startup")
+async def start_profiler():
+    profiling.start_sampler()
+
+@app.on_event("startup")
+async def warm_database():
+    """Precarga del page cache de la DB según DB_WARMUP ('sync' bloquea el arranque hasta terminar)."""
+    if DB_WARMUP == 'sync':
+        await asyncio.get_event_loop().run_in_executor(None, warm_page_cache)
+    elif DB_WARMUP == 'background':
+        threading.Thread(target=warm_page_cache, name="warm-db", daemon=True).start()
+
+@lru_cache(maxsize=1)
+def get_spatialite_version():
+    """Versión de SpatiaLite (se consulta una sola vez por proceso)."""
+    conn = get_db_connection()
+    try:
+        return conn.execute("SELECT spatialite_version()").fetchone()[0]
+    except Exception:
+        return False
+    finally:
+        conn.close()
+
+@app.get("/api/health/live")
+async def health_live():
+    """Liveness: el proceso responde. Sin I/O, apto para chequeos cada pocos segundos."""
+    return {"status": "ok"}
+
+@app.get("/api/health/ready")
+async def health_ready():
+    """
+    Readiness: la DB existe y es legible. Una DB de un ETL anterior (sin etl_layers/etl_build)
+    sigue lista, igual que en /api/health: se valida con sqlite_master y se reporta metadata: missing.
+    """
+    if not os.path.exists(DATABASE_PATH):
+        return JSONResponse({"status": "unavailable", "error": "db not found"}, status_code=503)
+    try:
+        meta = get_etl_metadata()
+    except Exception as e:
+        try:
+            tables = count_tables()
+        except Exception as err:
+            return JSONResponse({"status": "unavailable", "error": str(err)}, status_code=503)
+        if not tables:
+            return JSONResponse({"status": "unavailable", "error": "db sin tablas"}, status_code=503)
+        return {"status": "ok", "tables": tables, "metadata": "missing", "metadata_error": str(e)}
+    return {"status": "ok", "layers": len(meta["layers"]), "built_at": meta["build"].get("built_at"),
+            "metadata": "ok"}
+
 @app.get("/api/health")
 async def health():
-    """Diagnostic endpoint to verify database and SpatiaLite status."""
-    import sqlite3
+    """Diagnostic endpoint to verify database and SpatiaLite status (lee la metadata del ETL, sin COUNT(*))."""
     info = {"status": "ok", "db_exists": False, "tables": [], "spatialite": False}
     try:
         db_path = DATABASE_PATH
@@ -37,23 +95,19 @@ async def health():
         info["db_exists"] = os.path.exists(db_path)
         if info["db_exists"]:
             info["db_size_mb"] = round(os.path.getsize(db_path) / 1024 / 1024, 1)
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = [row[0] for row in cursor.fetchall()]
-            info["tables"] = tables
-            for t in tables:
-                try:
-                    cursor.execute(f"SELECT COUNT(*) FROM \"{t}\"")
-                    info[f"count_{t}"] = cursor.fetchone()[0]
-                except:
-                    pass
             try:
-                cursor.execute("SELECT spatialite_version()")
-                info["spatialite"] = cursor.fetchone()[0]
-            except:
-                info["spatialite"] = False
-            conn.close()
+                meta = get_etl_metadata()
+                info["tables"] = list(meta["layers"].keys())
+                info["layers"] = meta["layers"]
+                info["build"] = meta["build"]
+                for t, layer_info in meta["layers"].items():
+                    info[f"count_{t}"] = layer_info["feature_count"]
+            except Exception as e:
+                # DB de un ETL anterior sin etl_layers/etl_build
+                info["metadata_error"] = str(e)
+            info["spatialite"] = get_spatialite_version()
+            info["shards"] = [{"name": sh["name"], "layers": len(sh["layers"]), "remote": bool(sh["url"])}
+                              for sh in load_shards()]
         
         # Intentar leer log del ETL
         log_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist', 'etl_log.txt'))
@@ -71,6 +125,88 @@ async def health():
 # En modo WAL, las lecturas en SQLite pueden ser concurrentes sin bloqueos severos
 executor = ThreadPoolExecutor(max_workers=5)
 
+async def run_in_executor(fn, *args):
+    """Delega fn al executor midiendo la espera en cola (saturación) antes de que arranque."""
+    submitted = time.perf_counter()
+
+    def timed():
+        EXECUTOR_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - submitted)
+        EXECUTOR_ACTIVE.inc()
+        try:
+            return fn(*args)
+        finally:
+            EXECUTOR_ACTIVE.dec()
+
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, profiling.bind_thread(timed))
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latencia y tamaño de respuesta por ruta (plantilla, no URL concreta, para acotar cardinalidad)."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get('route')
+    route_path = getattr(route, 'path', 'unmatched')
+    REQUEST_SECONDS.labels(route=route_path, method=request.method, status=response.status_code).observe(
+        time.perf_counter() - start)
+    content_length = response.headers.get('content-length')
+    if content_length:
+        RESPONSE_BYTES.labels(route=route_path).observe(int(content_length))
+    return response
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profiling opt-in (PROFILING_ENABLED=1): captura perfil y SQL de requests más lentos que SLOW_REQUEST_SECONDS."""
+    capture = profiling.begin(request.method, request.url.path)
+    if capture is None:
+        return await call_next(request)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        profiling.end(capture)
+    duration = time.perf_counter() - start
+    if duration >= profiling.SLOW_REQUEST_SECONDS:
+        # EXPLAIN QUERY PLAN fuera del executor de la app para no competir con los requests
+        await asyncio.get_event_loop().run_in_executor(None, profiling.finish, capture, duration, get_db_connection)
+        response.headers['X-Profile-Id'] = capture.id
+    return response
+
+def check_admin_token(request: Request):
+    """Endpoints admin: deshabilitados (404) si ADMIN_TOKEN no está configurado."""
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        raise HTTPException(status_code=404, detail="Not found")
+    if request.headers.get('x-admin-token') != token:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/api/admin/slow-requests")
+async def slow_requests(request: Request, id: str = None, format: str = "json"):
+    """
+    Capturas recientes de requests lentos (más nueva primero). Con ?id=<profile>&format=collapsed
+    entrega los stacks en formato collapsed para flamegraph/speedscope.
+    """
+    check_admin_token(request)
+    captures = list(reversed(profiling.slow_captures))
+    if id is not None:
+        capture = next((c for c in captures if c.id == id), None)
+        if capture is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        if format == "collapsed":
+            return Response(content=capture.collapsed(), media_type="text/plain")
+        return json_response(request, capture.summary(top=200))
+    return json_response(request, {
+        "enabled": profiling.PROFILING_ENABLED,
+        "threshold_s": profiling.SLOW_REQUEST_SECONDS,
+        "captures": [c.summary() for c in captures],
+    })
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas en formato Prometheus."""
+    data, content_type = render_metrics(executor)
+    return Response(content=data, media_type=content_type)
+
 class GeoJSONPayload(BaseModel):
     type: str
     geometry: Dict[str, Any]
@@ -81,6 +217,7 @@ def run_spatial_query(query: str, parameters: tuple = ()) -> List[dict]:
     conn = get_db_connection()
     try:
         cursor = conn.cursor()
+        profiling.record_sql(query, parameters)
         cursor.execute(query, parameters)
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
@@ -90,12 +227,25 @@ def run_spatial_query(query: str, parameters: tuple = ()) -> List[dict]:
     finally:
         conn.close()
 
-def run_gpd_intersection(layer: str, geom_wkt: str) -> List[dict]:
+# Equivalente SQL del filtro bbox que hace GDAL en gpd.read_file (para las capturas de profiling)
+LAYER_BBOX_SQL = """
+SELECT * FROM "{layer}"
+WHERE ROWID IN (
+    SELECT rowid FROM SpatialIndex
+    WHERE f_table_name = ? AND search_frame = BuildMbr(?, ?, ?, ?, 4326)
+)
+"""
+
+def run_gpd_intersection(layer: str, geom_wkt: str, db_path: str = DATABASE_PATH) -> List[dict]:
     """Busca intersecciones contra una capa usando GeoPandas y bbox (índice espacial GDAL)."""
     try:
         geom = wkt.loads(geom_wkt)
         # Usamos bbox para que Fiona use el índice espacial R-Tree internamente de forma rápida
-        gdf = gpd.read_file(DATABASE_PATH, layer=layer, bbox=geom.bounds)
+        gpd = import_geo()
+        # GDAL no expone su SQL: registramos el filtro SpatialIndex equivalente para el EXPLAIN
+        profiling.record_sql(LAYER_BBOX_SQL.format(layer=layer), (layer, *geom.bounds),
+                             note=f"gpd.read_file bbox sobre {os.path.basename(db_path)}")
+        gdf = gpd.read_file(db_path, layer=layer, bbox=geom.bounds)
         if gdf.empty:
             return []
         
@@ -113,17 +263,41 @@ def run_gpd_intersection(layer: str, geom_wkt: str) -> List[dict]:
             intersecting['area_interseccion_ha'] = 0.0
             
         intersecting = intersecting.drop(columns=['geometry', 'GEOMETRY'], errors='ignore')
-        # Limpiar NaNs para que FastAPI pueda serializar a JSON correctamente
-        intersecting = intersecting.where(pd.notnull(intersecting), None)
+        # Categorías guardadas como códigos por el ETL -> valores legibles
+        intersecting = decode_dataframe(layer, intersecting)
+        # Los NaN/NA se serializan como null directamente en responses.dumps (orjson)
         return intersecting.to_dict('records')
     except Exception as e:
         logging.error(f"Error en capa {layer}: {e}")
         return []
 
+def run_sharded_intersection(layer: str, geom_wkt: str) -> List[dict]:
+    """
+    Enruta la intersección solo a los shards cuya banda de latitud toca el bbox del predio
+    (locales o en otro nodo); sin shards para la capa, consulta la DB principal.
+    """
+    _, miny, _, maxy = wkt.loads(geom_wkt).bounds
+    shards = shards_for_bbox(layer, miny, maxy)
+    if not shards:
+        return run_gpd_intersection(layer, geom_wkt)
+    results = []
+    for shard in shards:
+        if shard["url"]:
+            try:
+                results.append(query_remote(shard, layer, geom_wkt))
+            except Exception as e:
+                # Un resultado parcial parecería completo: la DB principal tiene la capa entera
+                logging.error(f"Error en shard remoto {shard['name']} ({layer}), usando DB principal: {e}")
+                return run_gpd_intersection(layer, geom_wkt)
+        else:
+            results.append(run_gpd_intersection(layer, geom_wkt, shard["path"]))
+    return merge_shard_results(results)
+
 def run_gpd_area(geom_wkt: str) -> float:
     """Calcula el área reproyectando a UTM 19S (EPSG:32719) en memoria con GeoPandas"""
     try:
         geom = wkt.loads(geom_wkt)
+        gpd = import_geo()
         gdf = gpd.GeoDataFrame(geometry=[geom], crs="EPSG:4326")
         gdf_proj = gdf.to_crs(epsg=32719)
         return float(gdf_proj.area.iloc[0] / 10000.0)
@@ -133,121 +307,130 @@ def run_gpd_area(geom_wkt: str) -> float:
 
 async def check_layer_intersection(layer: str, geom_wkt: str) -> List[dict]:
     """Busca intersecciones de manera asíncrona delegando a hilo."""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(executor, run_gpd_intersection, layer, geom_wkt)
+    def timed_intersection():
+        start = time.perf_counter()
+        with observe(LAYER_QUERY_SECONDS, layer=layer):
+            res = run_sharded_intersection(layer, geom_wkt)
+        profiling.annotate_layer(layer, time.perf_counter() - start, len(res))
+        return res
+    return await run_in_executor(timed_intersection)
+
+# Capas de restricción del reporte (las mismas que el ETL puede particionar en shards)
+CAPAS_AFECTACION = [
+    "sitios_prioritarios", "pertenencias_mineras", "concesiones_acuicultura", 
+    "ecmpo", "areas_marinas", "areas_protegidas", "ecosistemas",
+    "concesiones_mineras_const", "concesiones_mineras_tramite"
+]
+
+async def generar_reporte(geom) -> dict:
+    """Cruza la geometría del predio contra todas las capas de afectación y la DPA."""
+    if not geom.is_valid:
+        geom = geom.buffer(0)
+        
+    wkt = geom.wkt
+    # Para detectar polígonos patológicos en las capturas de requests lentos
+    profiling.annotate(geometry_type=geom.geom_type, vertices=shapely.get_num_coordinates(geom),
+                       wkt_bytes=len(wkt), bounds=list(geom.bounds))
+    
+    # Ejecución asíncrona y simultánea (Micro/Web)
+    capas_afectacion = CAPAS_AFECTACION
+    tareas = [check_layer_intersection(capa, wkt) for capa in capas_afectacion]
+    
+    # Esperamos a que todas las queries terminen en paralelo
+    resultados = await asyncio.gather(*tareas)
+    
+    # run_gpd_intersection ya descarta la columna GEOMETRY: no hace falta re-copiar los registros
+    restricciones = dict(zip(capas_afectacion, resultados))
+        
+    # Consulta de DPA (División Político Administrativa)
+    dpa_capas = ["regiones", "provincias", "comunas"]
+    dpa_tareas = [check_layer_intersection(capa, wkt) for capa in dpa_capas]
+    dpa_resultados = await asyncio.gather(*dpa_tareas)
+    
+    dpa_info = {"Region": [], "Provincia": [], "Comuna": []}
+
+    # El mojibake Latin-1/UTF-8 se corrige una sola vez en el ETL (fix_encoding)
+    if dpa_resultados[0]:
+        dpa_info["Region"] = list(set([item.get('region') for item in dpa_resultados[0] if item.get('region')]))
+    if dpa_resultados[1]:
+        dpa_info["Provincia"] = list(set([item.get('provincia') for item in dpa_resultados[1] if item.get('provincia')]))
+    if dpa_resultados[2]:
+        dpa_info["Comuna"] = list(set([item.get('comuna') for item in dpa_resultados[2] if item.get('comuna')]))
+    
+    # Inyectando el cálculo de área con GeoPandas (cross-platform robusto)
+    def timed_area():
+        with observe(AREA_SECONDS):
+            return run_gpd_area(wkt)
+    area_ha = await run_in_executor(timed_area)
+    
+    return {
+        "estado": "exito",
+        "area_total_ha": round(area_ha, 2) if area_ha else 0.0,
+        "dpa": dpa_info,
+        "restricciones": restricciones
+    }
 
 @app.post("/api/reporte-predio")
-async def reporte_predio(payload: GeoJSONPayload):
+async def reporte_predio(payload: GeoJSONPayload, request: Request):
     try:
         geom = shape(payload.geometry)
-        if not geom.is_valid:
-            geom = geom.buffer(0)
-            
-        wkt = geom.wkt
-        
-        # Ejecución asíncrona y simultánea (Micro/Web)
-        capas_afectacion = [
-            "sitios_prioritarios", "pertenencias_mineras", "concesiones_acuicultura", 
-            "ecmpo", "areas_marinas", "areas_protegidas", "ecosistemas",
-            "concesiones_mineras_const", "concesiones_mineras_tramite"
-        ]
-        tareas = [check_layer_intersection(capa, wkt) for capa in capas_afectacion]
-        
-        # Esperamos a que todas las queries terminen en paralelo
-        resultados = await asyncio.gather(*tareas)
-        
-        restricciones = {}
-        for capa, res in zip(capas_afectacion, resultados):
-            # Limpiamos el objeto GEOMETRY WKB en la salida JSON ya que no es serializable
-            res_limpio = [{k: v for k, v in dict_item.items() if k != 'GEOMETRY'} for dict_item in res]
-            restricciones[capa] = res_limpio
-            
-        # Consulta de DPA (División Político Administrativa)
-        dpa_capas = ["regiones", "provincias", "comunas"]
-        dpa_tareas = [check_layer_intersection(capa, wkt) for capa in dpa_capas]
-        dpa_resultados = await asyncio.gather(*dpa_tareas)
-        
-        dpa_info = {"Region": [], "Provincia": [], "Comuna": []}
-        
-        def fix_encoding(text):
-            if not isinstance(text, str): return text
-            try:
-                # Arreglo para mojibake "RegiÃ³n" -> "Región"
-                return text.encode('latin-1').decode('utf-8')
-            except:
-                return text
-
-        if dpa_resultados[0]:
-            dpa_info["Region"] = list(set([fix_encoding(item.get('region')) for item in dpa_resultados[0] if item.get('region')]))
-        if dpa_resultados[1]:
-            dpa_info["Provincia"] = list(set([fix_encoding(item.get('provincia')) for item in dpa_resultados[1] if item.get('provincia')]))
-        if dpa_resultados[2]:
-            dpa_info["Comuna"] = list(set([fix_encoding(item.get('comuna')) for item in dpa_resultados[2] if item.get('comuna')]))
-        
-        # Inyectando el cálculo de área con GeoPandas (cross-platform robusto)
-        loop = asyncio.get_event_loop()
-        area_ha = await loop.run_in_executor(executor, run_gpd_area, wkt)
-        
-        return {
-            "estado": "exito",
-            "area_total_ha": round(area_ha, 2) if area_ha else 0.0,
-            "dpa": dpa_info,
-            "restricciones": restricciones
-        }
+        return json_response(request, await generar_reporte(geom))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Rechaza subidas con Content-Length excesivo antes de recibir el cuerpo."""
+    if request.url.path == "/api/upload-predio":
+        content_length = request.headers.get('content-length')
+        # Margen de 64 KB para el envoltorio multipart
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + 64 * 1024:
+            return json_response(request, {"detail": "El archivo supera el tamaño máximo permitido."}, status_code=413)
+    return await call_next(request)
+
 @app.post("/api/upload-predio")
-async def upload_predio(file: UploadFile = File(...)):
-    """ Endpoint para procesar archivos espaciales subidos por el usuario (SHP zip, KML, GeoJSON) """
+async def upload_predio(request: Request, reporte: bool = False):
+    """
+    Endpoint para procesar archivos espaciales subidos por el usuario (SHP zip, KMZ, KML, GeoJSON)
+    en el campo multipart 'file'. El cuerpo se lee en streaming con tope de tamaño (receive_upload).
+    Con ?reporte=true se entrega además el reporte del predio, sin ida y vuelta por el navegador.
+    """
     try:
-        suffix = os.path.splitext(file.filename)[1].lower()
-        if suffix not in ['.zip', '.geojson', '.json', '.kml']:
-            suffix = '.tmp'
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
-        
-        loop = asyncio.get_event_loop()
-        
-        def process_file_sync(path):
-            read_path = path
-            if path.endswith('.zip'):
-                read_path = f"zip://{path}"
-            
-            gdf = gpd.read_file(read_path)
-            
-            # Limpiar geometrias vacias
-            gdf = gdf.dropna(subset=['geometry'])
-            if gdf.empty:
-                raise ValueError("El archivo no contenía geometrías válidas.")
-            
-            # Reproyectar a WGS84 (EPSG:4326) de ser necesario
-            if gdf.crs is None or gdf.crs.to_string() != 'EPSG:4326':
-                if gdf.crs is None:
-                    # Asumimos WGS84 si viene sin CRS (común en geojsons puros)
-                    gdf.set_crs(epsg=4326, inplace=True, allow_override=True)
-                else:
-                    gdf = gdf.to_crs(epsg=4326)
-
-            # Convertir el DataFrame directamente en un JSON tipo FeatureCollection
-            return json.loads(gdf.to_json())
-            
-        feature_collection = await loop.run_in_executor(executor, process_file_sync, tmp_path)
-        
-        os.remove(tmp_path)
-        return feature_collection
+        data, filename = await receive_upload(request)
+
+        def timed_parse():
+            with observe(UPLOAD_PARSE_SECONDS):
+                gdf = parse_upload(data, filename)
+                # FeatureCollection serializada una sola vez (sin json.loads + re-serialización)
+                return gdf, gdf.to_json().encode('utf-8')
+        gdf, feature_collection = await run_in_executor(timed_parse)
+
+        if not reporte:
+            return encode_response(request, feature_collection, 'application/geo+json')
 
+        resultado = await generar_reporte(gdf.geometry.unary_union)
+        body = b'{"predio":' + feature_collection + b',"reporte":' + dumps(resultado) + b'}'
+        return encode_response(request, body, 'application/json')
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
-        if 'tmp_path' in locals() and os.path.exists(tmp_path):
-            os.remove(tmp_path)
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Error leyendo el archivo espacial: {str(e)}")
 
+class ShardIntersectPayload(BaseModel):
+    wkt: str
+
+@app.post("/api/shard/intersect/{layer}")
+async def shard_intersect(layer: str, payload: ShardIntersectPayload, request: Request):
+    """Intersección sobre la DB local de este nodo; la usa el router de shards de otros nodos."""
+    if layer not in CAPAS_AFECTACION:
+        raise HTTPException(status_code=404, detail="Layer not sharded")
+    res = await run_in_executor(run_gpd_intersection, layer, payload.wkt)
+    return json_response(request, res)
+
 @app.get("/api/stats/region/{id_region}")
 async def stats_region(id_region: str):
     """Consulta Macro desde la Web"""
@@ -257,79 +440,60 @@ async def stats_region(id_region: str):
         JOIN division_politica dp ON ST_Intersects(c.GEOMETRY, dp.GEOMETRY)
         WHERE dp.region LIKE '%' || ? || '%'
     """
-    loop = asyncio.get_event_loop()
-    res = await loop.run_in_executor(executor, run_spatial_query, query, (id_region,))
+    res = await run_in_executor(run_spatial_query, query, (id_region,))
     return {
         "region": id_region,
         "conteo_pertenencias": len(res)
     }
 
-from fastapi import Response
+
+# Tiles MVT ya generados, guardados comprimidos con gzip
+MAX_TILE_ZOOM = 22
+tile_cache = TileCache(max_items=int(os.environ.get('TILE_CACHE_SIZE', '2048')))
 
 @app.get("/api/tiles/{layer}/{z}/{x}/{y}.pbf")
-async def get_tile(layer: str, z: int, x: int, y: int):
+async def get_tile(layer: str, z: int, x: int, y: int, request: Request):
     """
-    Genera dinámicamente un Vector Tile (MVT) desde SpatiaLite.
-    Optimizado para SpatiaLite 5.0 (ST_AsMVT es agregado y solo de geometría).
+    Genera dinámicamente un Vector Tile (MVT) desde SpatiaLite, con las propiedades
+    declaradas en tiles.TILE_LAYERS y el ROWID como id (para /api/feature/{layer}/{fid}).
     """
-    valid_layers = ["concesiones_mineras_const", "concesiones_mineras_tramite", "ecmpo", "ecosistemas", "areas_protegidas"]
-    if layer not in valid_layers:
+    if layer not in TILE_LAYERS:
         raise HTTPException(status_code=404, detail="Layer not tileable")
+    # Validar antes de tocar métricas o cache: z acota las series de TILE_SECONDS
+    if not (0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
 
-    WORLD_SIZE = 40075016.68557849
-    ORIGIN_X = -20037508.342789244
-    ORIGIN_Y = 20037508.342789244
-    tile_size = WORLD_SIZE / (2**z)
-    xmin = ORIGIN_X + x * tile_size
-    xmax = xmin + tile_size
-    ymax = ORIGIN_Y - y * tile_size
-    ymin = ymax - tile_size
-    
     def fetch_tile_sync():
+        # Si todos los shards que toca el tile son locales se arma solo con ellos (ids = feature_uid = ROWID
+        # principal); si alguno es remoto se usa la DB principal, que tiene la capa completa
+        _, ymin, _, ymax = tile_bounds(z, x, y)
+        shards = shards_for_bbox(layer, mercator_y_to_lat(ymin), mercator_y_to_lat(ymax))
+        if shards and not any(sh["url"] for sh in shards):
+            return build_tile_from_shards([s["path"] for s in shards], layer, z, x, y)
         conn = get_db_connection()
         try:
-            cursor = conn.cursor()
-            # Detectar columna de geometría
-            cursor.execute(f"PRAGMA table_info('{layer}')")
-            all_cols = [r[1] for r in cursor.fetchall()]
-            geom_col = next((c for c in all_cols if c.lower() in ['geometry', 'geom']), "geometry")
-
-            # SQL Universal: ST_Intersects directo (usa el optimizador RTree automático si existe)
-            # Agregamos filtro IS NOT NULL para evitar problemas con registros sin geometría
-            query = f"""
-            WITH 
-            bounds AS (
-                SELECT ST_MakeEnvelope(?, ?, ?, ?, 3857) AS geom
-            ),
-            mvt_geom AS (
-                SELECT 
-                    ST_AsMVTGeom(
-                        ST_Transform(t."{geom_col}", 3857), 
-                        (SELECT geom FROM bounds),
-                        4096, 64, true
-                    ) AS geom
-                FROM "{layer}" t
-                WHERE t."{geom_col}" IS NOT NULL 
-                AND ST_Intersects(t."{geom_col}", ST_Transform((SELECT geom FROM bounds), 4326))
-            )
-            SELECT ST_AsMVT(mvt_geom.geom, ?) FROM mvt_geom;
-            """
-            
-            cursor.execute(query, (xmin, ymin, xmax, ymax, layer, layer))
-            row = cursor.fetchone()
-            return row[0] if row else None
+            return build_tile(conn, layer, z, x, y)
         except Exception as e:
             logging.error(f"TILE ERROR [{layer} {z}/{x}/{y}]: {str(e)}")
             raise e
         finally:
             conn.close()
 
+    headers = {"Cache-Control": "public, max-age=3600", "Access-Control-Allow-Origin": "*"}
+    cache_key = (layer, z, x, y)
+    gz_data = tile_cache.get(cache_key)
+    CACHE_REQUESTS.labels(cache='tiles', result='hit' if gz_data is not None else 'miss').inc()
+    if gz_data is not None:
+        return tile_response(request, gz_data, headers)
+
+    def timed_tile():
+        with observe(TILE_SECONDS, layer=layer, z=str(z)):
+            return fetch_tile_sync()
+
     try:
-        loop = asyncio.get_event_loop()
-        mvt_data = await loop.run_in_executor(executor, fetch_tile_sync)
-        if not mvt_data: return Response(status_code=204)
-        return Response(content=mvt_data, media_type="application/vnd.mapbox-vector-tile",
-                        headers={"Cache-Control": "public, max-age=3600", "Access-Control-Allow-Origin": "*"})
+        mvt_data = await run_in_executor(timed_tile)
+        gz_data = tile_cache.put(cache_key, mvt_data)
+        return tile_response(request, gz_data, headers)
     except Exception as e:
         return Response(content=json.dumps({"error": str(e)}), status_code=500, media_type="application/json")
 
@@ -352,26 +516,140 @@ async def get_feature_info(layer: str, lat: float, lon: float):
             AND ST_Intersects("{geom_col}", GeomFromText('POINT(' || ? || ' ' || ? || ')', 4326))
             LIMIT 1;
             """
+            profiling.record_sql(query, (lon, lat))
             cursor.execute(query, (lon, lat))
             row = cursor.fetchone()
             if row:
                 d = dict(row)
                 if geom_col in d: del d[geom_col]
                 if 'GEOMETRY' in d: del d['GEOMETRY']
-                return d
+                return decode_record(layer, d)
             return None
         finally:
             conn.close()
 
     try:
-        loop = asyncio.get_event_loop()
-        info = await loop.run_in_executor(executor, fetch_info_sync)
+        info = await run_in_executor(fetch_info_sync)
         if not info: return {"error": "No feature found"}
         return info
     except Exception as e:
         logging.error(f"FEATURE INFO ERROR [{layer} {lat}/{lon}]: {str(e)}")
         return {"error": f"Internal Server Error: {str(e)}"}
 
+# Capas servibles por /api/features (las mismas que el ETL exporta para el mapa)
+FEATURE_LAYERS = ["concesiones_mineras_const", "concesiones_mineras_tramite", "ecmpo", "concesiones_acuicultura",
+                  "regiones", "provincias", "comunas"]
+FEATURES_PAGE_DEFAULT = 2000
+FEATURES_PAGE_MAX = 10000
+
+@app.get("/api/features/{layer}")
+async def get_features(layer: str, bbox: str, request: Request, z: int = 10, cursor: int = 0,
+                       limit: int = FEATURES_PAGE_DEFAULT, format: str = "geojson"):
+    """
+    Features de una capa dentro de un bbox (minx,miny,maxx,maxy en EPSG:4326), usando el índice
+    espacial de SpatiaLite, simplificadas según zoom y paginadas por cursor (ROWID).
+    La página siguiente se pide con ?cursor=<next_cursor>; next_cursor es null en la última.
+    """
+    if layer not in FEATURE_LAYERS:
+        raise HTTPException(status_code=404, detail="Layer not available")
+    if format not in ("geojson", "fgb"):
+        raise HTTPException(status_code=400, detail="format debe ser 'geojson' o 'fgb'")
+    try:
+        minx, miny, maxx, maxy = [float(v) for v in bbox.split(',')]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox debe ser minx,miny,maxx,maxy")
+    limit = max(1, min(limit, FEATURES_PAGE_MAX))
+    tolerance = simplify_tolerance(z)
+
+    def fetch_features_sync():
+        conn = get_db_connection()
+        try:
+            cursor_db = conn.cursor()
+            cursor_db.execute(f"PRAGMA table_info('{layer}')")
+            all_cols = [r[1] for r in cursor_db.fetchall()]
+            geom_col = next((c for c in all_cols if c.lower() in ['geometry', 'geom']), "geometry")
+
+            # SpatialIndex (R-Tree) filtra por bbox; la simplificación se hace en SpatiaLite
+            query = f"""
+            SELECT t.ROWID AS fid,
+                   AsGeoJSON(CASE WHEN ? > 0 THEN SimplifyPreserveTopology(t."{geom_col}", ?) ELSE t."{geom_col}" END, 6) AS geojson
+            FROM "{layer}" t
+            WHERE t.ROWID IN (
+                SELECT rowid FROM SpatialIndex
+                WHERE f_table_name = ? AND search_frame = BuildMbr(?, ?, ?, ?, 4326)
+            )
+            AND t.ROWID > ?
+            ORDER BY t.ROWID
+            LIMIT ?
+            """
+            params = (tolerance, tolerance, layer, minx, miny, maxx, maxy, cursor, limit + 1)
+            profiling.record_sql(query, params)
+            cursor_db.execute(query, params)
+            return [(row[0], row[1]) for row in cursor_db.fetchall()]
+        finally:
+            conn.close()
+
+    try:
+        rows = await run_in_executor(fetch_features_sync)
+    except Exception as e:
+        logging.error(f"FEATURES ERROR [{layer} {bbox}]: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # El cursor se calcula sobre las filas crudas: filtrar antes las geometrías nulas
+    # (AsGeoJSON NULL) saltaría features o cortaría la paginación antes de tiempo
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    rows = [row for row in rows[:limit] if row[1]]
+    headers = {"X-Next-Cursor": str(next_cursor) if next_cursor is not None else "",
+               "Cache-Control": "public, max-age=3600"}
+
+    if format == "fgb":
+        data = await run_in_executor(features_to_flatgeobuf, rows)
+        return Response(content=data, media_type="application/flatgeobuf", headers=headers)
+
+    def geojson_chunks():
+        yield b'{"type":"FeatureCollection","features":['
+        for i, (fid, geojson) in enumerate(rows):
+            prefix = b',' if i else b''
+            yield prefix + b'{"type":"Feature","id":' + str(fid).encode() + b',"properties":{"id":' + \
+                str(fid).encode() + b'},"geometry":' + geojson.encode('utf-8') + b'}'
+        yield b'],"next_cursor":' + dumps(next_cursor) + b'}'
+
+    return stream_response(request, geojson_chunks(), 'application/geo+json', headers=headers)
+
+def features_to_flatgeobuf(rows) -> bytes:
+    """Escribe las features (fid, geojson) a FlatGeobuf en memoria (GDAL /vsimem/)."""
+    from fiona.io import MemoryFile
+    schema = {"geometry": "Unknown", "properties": {"id": "int"}}
+    with MemoryFile(ext="fgb") as memfile:
+        with memfile.open(driver="FlatGeobuf", schema=schema, crs="EPSG:4326") as dst:
+            dst.writerecords({"geometry": json.loads(geojson), "properties": {"id": fid}} for fid, geojson in rows)
+        memfile.seek(0)
+        return memfile.read()
+
+@app.get("/api/feature/{layer}/{fid}")
+async def get_feature_by_id(layer: str, fid: int):
+    """Atributos completos de una feature por su id (ROWID), el mismo que llevan los tiles y /api/features."""
+    if layer not in TILE_LAYERS and layer not in FEATURE_LAYERS:
+        raise HTTPException(status_code=404, detail="Layer not available")
+
+    def fetch_feature_sync():
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT * FROM "{layer}" WHERE ROWID = ?', (fid,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            d = {k: row[k] for k in row.keys() if k.lower() not in ('geometry', 'geom')}
+            return decode_record(layer, d)
+        finally:
+            conn.close()
+
+    info = await run_in_executor(fetch_feature_sync)
+    if not info:
+        raise HTTPException(status_code=404, detail="Feature not found")
+    return info
+
 # Servir Frontend
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
@@ -393,6 +671,15 @@ data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'fronte
 if os.path.exists(frontend_dir):
     app.mount("/static", StaticFiles(directory=frontend_dir), name="frontend")
 
+@app.get("/data/{filename}.fgb")
+async def get_flatgeobuf(filename: str, request: Request):
+    """FlatGeobuf generados por el ETL, con soporte de HTTP Range (se registra antes del mount /data)."""
+    path = os.path.abspath(os.path.join(data_dir, f"{filename}.fgb"))
+    if os.path.dirname(path) != data_dir or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Not found")
+    return range_file_response(request, path, "application/flatgeobuf",
+                               headers={"Cache-Control": "public, max-age=3600"})
+
 # Asegurar que la carpeta de datos estáticos también se sirva
 if os.path.exists(data_dir):
     app.mount("/data", StaticFiles(directory=data_dir), name="data")
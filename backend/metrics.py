@@ -0,0 +1,42 @@
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Buckets en segundos: desde consultas puntuales (ms) hasta reportes de varios segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+LAYER_QUERY_SECONDS = Histogram('geoportal_layer_query_seconds', 'Intersección de una capa en el reporte de predio',
+                                ['layer'], buckets=LATENCY_BUCKETS)
+AREA_SECONDS = Histogram('geoportal_area_seconds', 'Cálculo de área del predio (reproyección UTM)',
+                         buckets=LATENCY_BUCKETS)
+TILE_SECONDS = Histogram('geoportal_tile_seconds', 'Generación de tiles MVT', ['layer', 'z'], buckets=LATENCY_BUCKETS)
+UPLOAD_PARSE_SECONDS = Histogram('geoportal_upload_parse_seconds', 'Lectura de archivos espaciales subidos',
+                                 buckets=LATENCY_BUCKETS)
+EXECUTOR_QUEUE_WAIT_SECONDS = Histogram('geoportal_executor_queue_wait_seconds',
+                                        'Espera en la cola del ThreadPoolExecutor antes de ejecutar',
+                                        buckets=LATENCY_BUCKETS)
+EXECUTOR_QUEUE_DEPTH = Gauge('geoportal_executor_queue_depth', 'Tareas pendientes en la cola del executor')
+EXECUTOR_ACTIVE = Gauge('geoportal_executor_active', 'Tareas ejecutándose en el executor')
+DB_CONNECT_SECONDS = Histogram('geoportal_db_connect_seconds', 'Apertura de conexión SpatiaLite (incluye extensión)',
+                               buckets=LATENCY_BUCKETS)
+CACHE_REQUESTS = Counter('geoportal_cache_requests_total', 'Consultas a caches en memoria', ['cache', 'result'])
+REQUEST_SECONDS = Histogram('geoportal_request_seconds', 'Latencia HTTP por ruta', ['route', 'method', 'status'],
+                            buckets=LATENCY_BUCKETS)
+RESPONSE_BYTES = Histogram('geoportal_response_bytes', 'Tamaño de respuesta (ya comprimida) por ruta', ['route'],
+                           buckets=SIZE_BUCKETS)
+
+@contextmanager
+def observe(histogram, **labels):
+    """Mide la duración del bloque en el histograma (con labels opcionales)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        (histogram.labels(**labels) if labels else histogram).observe(time.perf_counter() - start)
+
+def render_metrics(executor) -> tuple:
+    """Formato de exposición Prometheus; actualiza la profundidad de la cola al momento del scrape."""
+    EXECUTOR_QUEUE_DEPTH.set(executor._work_queue.qsize())
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,183 @@
+import os
+import sys
+import time
+import uuid
+import logging
+import threading
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Optional
+
+# Profiling opt-in: muestrea stacks de los hilos del executor que atienden cada request y
+# guarda perfil + SQL + EXPLAIN QUERY PLAN de los requests más lentos que el umbral
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '5'))
+SAMPLE_INTERVAL = float(os.environ.get('PROFILING_SAMPLE_MS', '10')) / 1000.0
+MAX_CAPTURES = int(os.environ.get('PROFILING_MAX_CAPTURES', '50'))
+MAX_SQL_PER_REQUEST = 100
+
+class Capture:
+    """Perfil de un request: stacks muestreados, SQL ejecutado y anotaciones (geometría, capas)."""
+
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.duration = None
+        self.samples = Counter()
+        self.sql = []
+        self.annotations = {}
+        self.lock = threading.Lock()
+
+    def summary(self, top: int = 20) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration_s": round(self.duration or 0.0, 3),
+            "samples": sum(self.samples.values()),
+            "top_stacks": [{"stack": stack, "samples": n} for stack, n in self.samples.most_common(top)],
+            "sql": [{k: v for k, v in entry.items() if not k.startswith('_')} for entry in self.sql],
+            "annotations": self.annotations,
+        }
+
+    def collapsed(self) -> str:
+        """Stacks en formato 'collapsed' (compatible con flamegraph.pl / speedscope)."""
+        return "\n".join(f"{stack} {n}" for stack, n in self.samples.most_common())
+
+_current: ContextVar[Optional[Capture]] = ContextVar('profiling_capture', default=None)
+_active_threads = {}
+# Hilo del event loop -> capturas en curso. El loop es compartido: sus muestras (orjson, compresión,
+# parseo de geometrías) se atribuyen a todos los requests capturados activos, con prefijo 'event-loop'
+_loop_threads = {}
+_active_lock = threading.Lock()
+slow_captures = deque(maxlen=MAX_CAPTURES)
+_sampler_started = False
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+def _sampler_loop():
+    while True:
+        time.sleep(SAMPLE_INTERVAL)
+        with _active_lock:
+            active = list(_active_threads.items())
+            loops = [(ident, list(captures)) for ident, captures in _loop_threads.items() if captures]
+        if not active and not loops:
+            continue
+        frames = sys._current_frames()
+        for ident, capture in active:
+            frame = frames.get(ident)
+            if frame is not None:
+                stack = _collapse(frame)
+                with capture.lock:
+                    capture.samples[stack] += 1
+        for ident, captures in loops:
+            frame = frames.get(ident)
+            if frame is not None:
+                stack = "event-loop;" + _collapse(frame)
+                for capture in captures:
+                    with capture.lock:
+                        capture.samples[stack] += 1
+
+def start_sampler():
+    """Arranca el hilo muestreador (una vez por proceso) si el profiling está habilitado."""
+    global _sampler_started
+    if PROFILING_ENABLED and not _sampler_started:
+        _sampler_started = True
+        threading.Thread(target=_sampler_loop, name="profiler-sampler", daemon=True).start()
+
+def begin(method: str, path: str) -> Optional[Capture]:
+    if not PROFILING_ENABLED:
+        return None
+    capture = Capture(method, path)
+    _current.set(capture)
+    # begin() corre en el event loop: se muestrea mientras el request esté activo
+    capture.loop_ident = threading.get_ident()
+    with _active_lock:
+        _loop_threads.setdefault(capture.loop_ident, set()).add(capture)
+    return capture
+
+def end(capture: Capture):
+    """Deja de muestrear el event loop para este request."""
+    with _active_lock:
+        _loop_threads.get(capture.loop_ident, set()).discard(capture)
+
+def bind_thread(fn):
+    """
+    Envuelve fn (a ejecutar en el executor) para que el hilo que la corra se muestree como parte
+    del request actual. Debe llamarse desde el contexto async del request.
+    """
+    capture = _current.get()
+    if capture is None:
+        return fn
+
+    def bound(*args):
+        token = _current.set(capture)
+        ident = threading.get_ident()
+        with _active_lock:
+            _active_threads[ident] = capture
+        try:
+            return fn(*args)
+        finally:
+            with _active_lock:
+                _active_threads.pop(ident, None)
+            _current.reset(token)
+    return bound
+
+def record_sql(query: str, params=(), note: str = None):
+    """
+    Registra una consulta del request actual (su plan se obtiene solo si el request resulta lento).
+    `note` aclara cuando la consulta es el equivalente SQL de una lectura hecha por GDAL.
+    """
+    capture = _current.get()
+    if capture is not None and len(capture.sql) < MAX_SQL_PER_REQUEST:
+        entry = {"query": " ".join(query.split()), "params": [repr(p) for p in params], "_params": tuple(params)}
+        if note:
+            entry["note"] = note
+        with capture.lock:
+            capture.sql.append(entry)
+
+def annotate(**kwargs):
+    """Agrega datos al perfil del request actual (ej. tamaño y vértices de la geometría de entrada)."""
+    capture = _current.get()
+    if capture is not None:
+        with capture.lock:
+            capture.annotations.update(kwargs)
+
+def annotate_layer(layer: str, seconds: float, rows: int):
+    capture = _current.get()
+    if capture is not None:
+        with capture.lock:
+            capture.annotations.setdefault("layers", {})[layer] = {"seconds": round(seconds, 4), "rows": rows}
+
+def finish(capture: Capture, duration: float, explain_conn_factory):
+    """Cierra el perfil; si superó el umbral, agrega EXPLAIN QUERY PLAN de cada SQL y lo guarda."""
+    capture.duration = duration
+    if duration < SLOW_REQUEST_SECONDS:
+        return
+    conn = None
+    try:
+        for entry in capture.sql:
+            params = entry.pop("_params", ())
+            if conn is None:
+                conn = explain_conn_factory()
+            try:
+                plan = conn.execute("EXPLAIN QUERY PLAN " + entry["query"], params).fetchall()
+                entry["plan"] = [row[-1] for row in plan]
+            except Exception as e:
+                entry["plan_error"] = str(e)
+    except Exception as e:
+        logging.error(f"PROFILING: no se pudo obtener EXPLAIN para {capture.path}: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+    slow_captures.append(capture)
+    logging.warning(f"SLOW REQUEST {capture.method} {capture.path} {duration:.2f}s (profile {capture.id})")
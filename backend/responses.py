@@ -0,0 +1,172 @@
+import gzip
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se negocia solo gzip
+    brotli = None
+
+# Bajo este tamaño comprimir cuesta más de lo que ahorra
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+RANGE_CHUNK_BYTES = 256 * 1024
+
+def _orjson_default(obj):
+    """Tipos de pandas/numpy que orjson no serializa de forma nativa."""
+    nombre = type(obj).__name__
+    if nombre in ('NAType', 'NaTType'):
+        return None
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f"Tipo no serializable a JSON: {nombre}")
+
+def dumps(data: Any) -> bytes:
+    """Serializa a JSON con orjson (numpy nativo, NaN -> null, sin pasar por jsonable_encoder)."""
+    return orjson.dumps(data, default=_orjson_default,
+                        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+def accepted_encodings(request: Request) -> set:
+    """Codificaciones aceptadas por el cliente según Accept-Encoding (ignora q=0)."""
+    encodings = set()
+    for part in request.headers.get('accept-encoding', '').split(','):
+        token, _, params = part.strip().partition(';')
+        if token and params.replace(' ', '') not in ('q=0', 'q=0.0'):
+            encodings.add(token.lower())
+    return encodings
+
+def encode_response(request: Request, body: bytes, media_type: str, status_code: int = 200,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+    """Construye la respuesta comprimiendo el cuerpo con brotli o gzip según lo que acepte el cliente."""
+    headers = dict(headers or {})
+    headers['Vary'] = 'Accept-Encoding'
+    if len(body) >= MIN_COMPRESS_BYTES:
+        encodings = accepted_encodings(request)
+        if brotli is not None and 'br' in encodings:
+            body = brotli.compress(body, quality=BROTLI_QUALITY)
+            headers['Content-Encoding'] = 'br'
+        elif 'gzip' in encodings:
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers['Content-Encoding'] = 'gzip'
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+def json_response(request: Request, data: Any, status_code: int = 200) -> Response:
+    """Respuesta JSON rápida y comprimida."""
+    return encode_response(request, dumps(data), 'application/json', status_code=status_code)
+
+class TileCache:
+    """Cache LRU en memoria de tiles MVT, guardados ya comprimidos con gzip."""
+
+    def __init__(self, max_items: int = 2048):
+        self.max_items = max_items
+        self._items: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key: tuple, mvt_data: bytes) -> bytes:
+        """Comprime y guarda el tile. Un tile vacío se guarda como b'' para no recalcularlo."""
+        gz = gzip.compress(mvt_data, compresslevel=GZIP_LEVEL) if mvt_data else b''
+        with self._lock:
+            self._items[key] = gz
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return gz
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+def tile_response(request: Request, gz_data: bytes, headers: Dict[str, str]) -> Response:
+    """Sirve un tile pre-comprimido; solo se descomprime si el cliente no acepta gzip."""
+    if not gz_data:
+        return Response(status_code=204, headers=headers)
+    headers = dict(headers)
+    headers['Vary'] = 'Accept-Encoding'
+    if 'gzip' in accepted_encodings(request):
+        headers['Content-Encoding'] = 'gzip'
+        body = gz_data
+    else:
+        body = gzip.decompress(gz_data)
+    return Response(content=body, media_type="application/vnd.mapbox-vector-tile", headers=headers)
+
+def stream_response(request: Request, chunks: Iterable[bytes], media_type: str,
+                    headers: Optional[Dict[str, str]] = None) -> StreamingResponse:
+    """Respuesta por streaming, comprimida con gzip incremental si el cliente lo acepta."""
+    headers = dict(headers or {})
+    headers['Vary'] = 'Accept-Encoding'
+    if 'gzip' in accepted_encodings(request):
+        headers['Content-Encoding'] = 'gzip'
+        chunks = _gzip_stream(chunks)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+def _gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31 -> formato gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def range_file_response(request: Request, path: str, media_type: str,
+                        headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Sirve un archivo estático soportando HTTP Range (un único rango 'bytes=inicio-fin'),
+    para que clientes FlatGeobuf lean solo el índice y las features de su bbox.
+    """
+    headers = dict(headers or {})
+    headers['Accept-Ranges'] = 'bytes'
+    size = os.path.getsize(path)
+    range_header = request.headers.get('range')
+    if not range_header:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    unit, _, spec = range_header.partition('=')
+    start_s, _, end_s = spec.split(',')[0].strip().partition('-')
+    try:
+        if unit.strip() != 'bytes':
+            raise ValueError(unit)
+        if start_s:
+            start = int(start_s)
+            end = min(int(end_s), size - 1) if end_s else size - 1
+        else:
+            # Sufijo: 'bytes=-N' son los últimos N bytes
+            start = max(size - int(end_s), 0)
+            end = size - 1
+        if start > end or start >= size:
+            raise ValueError(range_header)
+    except ValueError:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status_code=416, headers=headers)
+
+    headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    headers['Content-Length'] = str(end - start + 1)
+    # Generador síncrono: Starlette lo itera en el threadpool, sin I/O bloqueante en el event loop
+    return StreamingResponse(_read_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+def _read_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
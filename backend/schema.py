@@ -0,0 +1,82 @@
+import sqlite3
+import logging
+from functools import lru_cache
+from typing import Dict
+
+from database import get_db_connection, _database_uri, DATABASE_PATH
+
+@lru_cache(maxsize=None)
+def get_diccionarios(layer: str) -> Dict[str, Dict[int, str]]:
+    """Diccionarios de categorías de una capa ({columna: {codigo: valor}}), escritos por el ETL."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT columna, codigo, valor FROM etl_diccionarios WHERE layer = ?", (layer,))
+        diccionarios: Dict[str, Dict[int, str]] = {}
+        for columna, codigo, valor in cursor.fetchall():
+            diccionarios.setdefault(columna, {})[codigo] = valor
+        return diccionarios
+    except sqlite3.OperationalError as e:
+        # DB generada por un ETL anterior (sin metadata de esquema)
+        logging.warning(f"Sin diccionarios de esquema para {layer}: {e}")
+        return {}
+    finally:
+        conn.close()
+
+@lru_cache(maxsize=None)
+def get_esquema(layer: str) -> Dict[str, str]:
+    """Tipo inferido por el ETL para cada columna de la capa ({columna: tipo})."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT columna, tipo FROM etl_schema WHERE layer = ?", (layer,))
+        return {columna: tipo for columna, tipo in cursor.fetchall()}
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+
+def decode_dataframe(layer: str, df):
+    """Reemplaza en el DataFrame los códigos de categorías por su valor original."""
+    for columna, mapa in get_diccionarios(layer).items():
+        if columna in df.columns:
+            df[columna] = df[columna].map(mapa)
+    return df
+
+def decode_record(layer: str, record: dict) -> dict:
+    """Igual que decode_dataframe pero para un registro individual (dict)."""
+    for columna, mapa in get_diccionarios(layer).items():
+        if record.get(columna) is not None:
+            record[columna] = mapa.get(record[columna])
+    return record
+
+def _read_only_connection():
+    """Conexión sqlite3 sin SpatiaLite a la DB principal, con la misma URI que el resto del backend."""
+    uri = _database_uri(DATABASE_PATH)
+    # Respeta immutable; en modo 'rw' igual se lee como ro
+    return sqlite3.connect(uri if '?' in uri else uri + "?mode=ro", uri=True)
+
+def count_tables() -> int:
+    """Cantidad de tablas en sqlite_master: chequeo barato de que la DB es legible (sin metadata del ETL)."""
+    conn = _read_only_connection()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table'").fetchone()[0]
+    finally:
+        conn.close()
+
+def get_etl_metadata() -> dict:
+    """
+    Conteos por capa (etl_layers) e info del build (etl_build) escritos por el ETL.
+    Usa una conexión sqlite3 de solo lectura sin SpatiaLite: son tablas chicas, lectura O(1).
+    """
+    conn = _read_only_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT layer, feature_count, size_bytes, updated_at FROM etl_layers")
+        layers = {layer: {"feature_count": count, "size_bytes": size, "updated_at": updated}
+                  for layer, count, size, updated in cursor.fetchall()}
+        cursor.execute("SELECT clave, valor FROM etl_build")
+        build = dict(cursor.fetchall())
+        return {"layers": layers, "build": build}
+    finally:
+        conn.close()
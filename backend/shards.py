@@ -0,0 +1,71 @@
+import os
+import json
+import math
+import logging
+import urllib.request
+from functools import lru_cache
+from typing import List
+
+from database import DATABASE_PATH
+
+# Manifest escrito por el ETL con SHARD_MODE=lat_bands; sin manifest todo se consulta en la DB principal
+SHARD_MANIFEST = os.environ.get('SHARD_MANIFEST', f"{os.path.splitext(DATABASE_PATH)[0]}.shards.json")
+SHARD_REMOTE_TIMEOUT = float(os.environ.get('SHARD_REMOTE_TIMEOUT', '30'))
+
+@lru_cache(maxsize=1)
+def load_shards() -> List[dict]:
+    """
+    Shards del manifest, con su ruta absoluta. Un shard se sirve desde otro nodo si se define
+    SHARD_URL_<NOMBRE> (ej. SHARD_URL_NORTE=http://geoportal-norte:8000) o 'url' en el manifest.
+    """
+    if not os.path.exists(SHARD_MANIFEST):
+        return []
+    with open(SHARD_MANIFEST, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(SHARD_MANIFEST))
+    shards = []
+    for shard in manifest.get("shards", []):
+        shard = dict(shard)
+        shard["path"] = os.path.join(base_dir, shard["path"])
+        shard["url"] = os.environ.get(f"SHARD_URL_{shard['name'].upper()}", shard.get("url"))
+        shards.append(shard)
+    logging.info(f"[SHARDS] {len(shards)} shards cargados desde {SHARD_MANIFEST}")
+    return shards
+
+def shards_for_bbox(layer: str, lat_min: float, lat_max: float) -> List[dict]:
+    """
+    Shards que contienen la capa y cuya banda de latitud se solapa con [lat_min, lat_max].
+    Si el bbox sale del rango que cubren los shards de la capa (manifest con bandas cerradas) retorna
+    [] y la consulta va a la DB principal: las features fuera de las bandas no están en ningún shard.
+    """
+    layer_shards = [s for s in load_shards() if layer in s["layers"]]
+    if not layer_shards:
+        return []
+    if lat_min < min(s["lat_min"] for s in layer_shards) or lat_max > max(s["lat_max"] for s in layer_shards):
+        return []
+    return [s for s in layer_shards if s["lat_max"] >= lat_min and s["lat_min"] <= lat_max]
+
+def mercator_y_to_lat(y: float) -> float:
+    return math.degrees(math.atan(math.sinh(y / 6378137.0)))
+
+def query_remote(shard: dict, layer: str, geom_wkt: str) -> List[dict]:
+    """Intersección ejecutada por el nodo que sirve el shard (/api/shard/intersect/{layer})."""
+    body = json.dumps({"wkt": geom_wkt}).encode('utf-8')
+    req = urllib.request.Request(f"{shard['url'].rstrip('/')}/api/shard/intersect/{layer}", data=body,
+                                 headers={"Content-Type": "application/json"}, method="POST")
+    with urllib.request.urlopen(req, timeout=SHARD_REMOTE_TIMEOUT) as resp:
+        return json.loads(resp.read())
+
+def merge_shard_results(results: List[List[dict]]) -> List[dict]:
+    """Une resultados de varios shards descartando duplicados de features que cruzan bandas."""
+    seen = set()
+    merged = []
+    for res in results:
+        for item in res:
+            uid = item.pop("feature_uid", None)
+            if uid is not None:
+                if uid in seen:
+                    continue
+                seen.add(uid)
+            merged.append(item)
+    return merged
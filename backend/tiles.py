@@ -0,0 +1,120 @@
+import mapbox_vector_tile
+from shapely import wkb
+from shapely.geometry import box
+
+from database import get_db_connection
+from schema import get_diccionarios
+from profiling import record_sql
+
+WORLD_SIZE = 40075016.68557849
+ORIGIN_X = -20037508.342789244
+ORIGIN_Y = 20037508.342789244
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# Propiedades embebidas en los tiles por capa: (columna, zoom mínimo desde el que se incluye).
+# Columnas que no existan en la capa se ignoran. El ROWID va siempre como id de la feature.
+TILE_LAYERS = {
+    "concesiones_mineras_const": [("situacion", 0), ("tipo_conce", 8), ("titular_no", 11), ("nombre", 12)],
+    "concesiones_mineras_tramite": [("situacion", 0), ("tipo_conce", 8), ("titular_no", 11), ("nombre", 12)],
+    "ecmpo": [("estado", 0), ("nombre", 10)],
+    "ecosistemas": [("formacion", 0), ("piso", 9), ("codigo", 9)],
+    "areas_protegidas": [("designacio", 0), ("codrnap", 10), ("nombreorig", 10)],
+}
+
+def simplify_tolerance(z: int) -> float:
+    """Tolerancia de simplificación (grados) equivalente a medio pixel en el zoom dado; 0 desde z14."""
+    if z >= 14:
+        return 0.0
+    return 360.0 / (256 * 2 ** z) / 2
+
+def tile_bounds(z: int, x: int, y: int) -> tuple:
+    """Bounds del tile en EPSG:3857 (xmin, ymin, xmax, ymax)."""
+    tile_size = WORLD_SIZE / (2 ** z)
+    xmin = ORIGIN_X + x * tile_size
+    ymax = ORIGIN_Y - y * tile_size
+    return xmin, ymax - tile_size, xmin + tile_size, ymax
+
+def tile_features(conn, layer: str, z: int, x: int, y: int) -> list:
+    """
+    Features de la capa para el tile (geometría en EPSG:3857 recortada + propiedades según
+    TILE_LAYERS y el zoom). En shards el id es feature_uid, igual al ROWID de la DB principal.
+    """
+    cursor = conn.cursor()
+    # Detectar columna de geometría
+    cursor.execute(f"PRAGMA table_info('{layer}')")
+    all_cols = [r[1] for r in cursor.fetchall()]
+    geom_col = next((c for c in all_cols if c.lower() in ['geometry', 'geom']), "geometry")
+    id_col = 't."feature_uid"' if 'feature_uid' in all_cols else 't.ROWID'
+    props = [col for col, min_zoom in TILE_LAYERS[layer] if z >= min_zoom and col in all_cols]
+
+    xmin, ymin, xmax, ymax = tile_bounds(z, x, y)
+    pad = (xmax - xmin) * TILE_BUFFER / TILE_EXTENT
+    clip = (xmin - pad, ymin - pad, xmax + pad, ymax + pad)
+    tolerance = simplify_tolerance(z)
+
+    # SpatialIndex (R-Tree) filtra por bbox; simplificamos antes de reproyectar para no
+    # transformar vértices que el tile no puede representar
+    props_sql = "".join(f', t."{col}"' for col in props)
+    query = f"""
+    SELECT {id_col},
+           AsBinary(ST_Transform(CASE WHEN ? > 0 THEN SimplifyPreserveTopology(t."{geom_col}", ?) ELSE t."{geom_col}" END, 3857))
+           {props_sql}
+    FROM "{layer}" t
+    WHERE t.ROWID IN (
+        SELECT rowid FROM SpatialIndex
+        WHERE f_table_name = ? AND search_frame = ST_Transform(BuildMbr(?, ?, ?, ?, 3857), 4326)
+    )
+    """
+    params = (tolerance, tolerance, layer, *clip)
+    record_sql(query, params)
+    cursor.execute(query, params)
+
+    diccionarios = get_diccionarios(layer)
+    features = []
+    clip_box = box(*clip)
+    for row in cursor.fetchall():
+        if row[1] is None:
+            continue
+        geom = wkb.loads(bytes(row[1]))
+        if not geom.intersects(clip_box):
+            continue
+        geom = geom.intersection(clip_box) if not clip_box.contains(geom) else geom
+        if geom.is_empty:
+            continue
+        properties = {}
+        for col, value in zip(props, row[2:]):
+            if col in diccionarios and value is not None:
+                value = diccionarios[col].get(value)
+            # MVT no admite valores nulos
+            if value is not None:
+                properties[col] = value
+        features.append({"id": row[0], "geometry": geom, "properties": properties})
+    return features
+
+def encode_tile(layer: str, features: list, z: int, x: int, y: int) -> bytes:
+    """Codifica el MVT; el encoder deduplica claves y valores por capa, como exige la especificación."""
+    if not features:
+        return b''
+    return mapbox_vector_tile.encode(
+        [{"name": layer, "features": features}],
+        default_options={"quantize_bounds": tile_bounds(z, x, y), "extents": TILE_EXTENT},
+    )
+
+def build_tile(conn, layer: str, z: int, x: int, y: int) -> bytes:
+    """Genera el MVT de una capa con geometría + propiedades desde una conexión SpatiaLite."""
+    return encode_tile(layer, tile_features(conn, layer, z, x, y), z, x, y)
+
+def build_tile_from_shards(db_paths: list, layer: str, z: int, x: int, y: int) -> bytes:
+    """Genera el MVT combinando los shards locales que toca el tile (sin duplicar features que cruzan bandas)."""
+    features, seen = [], set()
+    for db_path in db_paths:
+        conn = get_db_connection(db_path)
+        try:
+            for feature in tile_features(conn, layer, z, x, y):
+                if feature["id"] not in seen:
+                    seen.add(feature["id"])
+                    features.append(feature)
+        finally:
+            conn.close()
+    return encode_tile(layer, features, z, x, y)
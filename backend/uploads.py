@@ -0,0 +1,143 @@
+import io
+import os
+import zipfile
+from itertools import islice
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from geo import import_geo
+
+# Límites de subida (configurables por entorno)
+MAX_UPLOAD_BYTES = int(float(os.environ.get('MAX_UPLOAD_MB', '20')) * 1024 * 1024)
+MAX_UPLOAD_FEATURES = int(os.environ.get('MAX_UPLOAD_FEATURES', '5000'))
+
+# Extensiones que GDAL puede leer directamente desde memoria (/vsimem/)
+VECTOR_EXTENSIONS = ('.geojson', '.json', '.kml', '.gpkg')
+
+class UploadTooLarge(ValueError):
+    """El archivo subido supera MAX_UPLOAD_BYTES o MAX_UPLOAD_FEATURES."""
+
+def _too_large():
+    return UploadTooLarge(f"El archivo supera el máximo de {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+
+async def receive_upload(request, field_name: str = 'file') -> tuple:
+    """
+    Recibe el multipart directamente de request.stream() y guarda solo la parte `field_name` en
+    memoria, abortando apenas se supera MAX_UPLOAD_BYTES (también sin Content-Length, ej. chunked).
+    Retorna (bytes, filename). Evita el SpooledTemporaryFile de UploadFile, que pasa a disco sobre 1 MB.
+    """
+    content_type, params = parse_options_header(request.headers.get('content-type', ''))
+    boundary = params.get(b'boundary')
+    if content_type != b'multipart/form-data' or not boundary:
+        raise ValueError("Se esperaba un formulario multipart/form-data.")
+
+    part = {"headers": {}, "field": b'', "value": b''}
+    result = {"data": io.BytesIO(), "filename": None, "found": False}
+
+    def on_part_begin():
+        part["headers"] = {}
+        part["target"] = None
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][part["field"].lower()] = part["value"]
+        part["field"], part["value"] = b'', b''
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part["headers"].get(b'content-disposition', b''))
+        if disposition.get(b'name', b'').decode('utf-8', 'replace') == field_name and not result["found"]:
+            result["found"] = True
+            result["filename"] = disposition.get(b'filename', b'').decode('utf-8', 'replace')
+            part["target"] = result["data"]
+
+    def on_part_data(data, start, end):
+        target = part.get("target")
+        if target is not None:
+            target.write(data[start:end])
+            if target.tell() > MAX_UPLOAD_BYTES:
+                raise _too_large()
+
+    parser = MultipartParser(boundary, callbacks={
+        'on_part_begin': on_part_begin, 'on_part_data': on_part_data,
+        'on_header_field': on_header_field, 'on_header_value': on_header_value,
+        'on_header_end': on_header_end, 'on_headers_finished': on_headers_finished,
+    })
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        # Margen de 64 KB para el envoltorio multipart y otros campos
+        if received > MAX_UPLOAD_BYTES + 64 * 1024:
+            raise _too_large()
+        parser.write(chunk)
+    parser.finalize()
+
+    if not result["found"]:
+        raise ValueError(f"El formulario no contiene el campo '{field_name}'.")
+    return result["data"].getvalue(), result["filename"]
+
+def _read_collection(collection):
+    """Lee las features de una colección de Fiona respetando MAX_UPLOAD_FEATURES."""
+    features = list(islice(collection, MAX_UPLOAD_FEATURES + 1))
+    if len(features) > MAX_UPLOAD_FEATURES:
+        raise UploadTooLarge(f"El archivo supera el máximo de {MAX_UPLOAD_FEATURES} geometrías.")
+    gpd = import_geo()
+    return gpd.GeoDataFrame.from_features(features, crs=collection.crs_wkt or None)
+
+def _read_memory(data: bytes, ext: str):
+    from fiona.io import MemoryFile
+    with MemoryFile(data, ext=ext.lstrip('.')) as memfile:
+        with memfile.open() as collection:
+            return _read_collection(collection)
+
+def _read_zip(data: bytes):
+    """Shapefile zipeado (leído vía /vsizip/ sobre memoria) o un zip con un único vector."""
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        names = [n for n in zf.namelist() if not n.startswith('__MACOSX/')]
+        shp = next((n for n in names if n.lower().endswith('.shp')), None)
+        if shp is None:
+            inner = next((n for n in names if n.lower().endswith(VECTOR_EXTENSIONS)), None)
+            if inner is None:
+                raise ValueError("El zip no contiene un shapefile, KML o GeoJSON.")
+            return _read_memory(zf.read(inner), os.path.splitext(inner)[1].lower())
+    from fiona.io import ZipMemoryFile
+    with ZipMemoryFile(data) as memfile:
+        with memfile.open(shp) as collection:
+            return _read_collection(collection)
+
+def parse_upload(data: bytes, filename: str):
+    """
+    Lee un archivo espacial subido (SHP zip, KMZ, KML, GeoJSON) completamente en memoria,
+    sin archivos temporales, y lo devuelve en EPSG:4326.
+    """
+    suffix = os.path.splitext(filename or '')[1].lower()
+    if suffix == '.zip':
+        gdf = _read_zip(data)
+    elif suffix == '.kmz':
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            kml = next((n for n in zf.namelist() if n.lower().endswith('.kml')), None)
+            if kml is None:
+                raise ValueError("El KMZ no contiene un archivo KML.")
+            gdf = _read_memory(zf.read(kml), '.kml')
+    else:
+        gdf = _read_memory(data, suffix if suffix in VECTOR_EXTENSIONS else '.geojson')
+
+    # Limpiar geometrias vacias
+    gdf = gdf.dropna(subset=['geometry'])
+    if gdf.empty:
+        raise ValueError("El archivo no contenía geometrías válidas.")
+
+    # Reproyectar a WGS84 (EPSG:4326) de ser necesario
+    if gdf.crs is None:
+        # Asumimos WGS84 si viene sin CRS (común en geojsons puros)
+        gdf = gdf.set_crs(epsg=4326, allow_override=True)
+    elif gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(epsg=4326)
+    return gdf
@@ -0,0 +1 @@
+"""Benchmarks offline del backend sobre una base SpatiaLite sintética (ver README)."""
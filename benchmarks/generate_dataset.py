@@ -0,0 +1,138 @@
+"""
+Genera una base SpatiaLite sintética con tamaños y densidad de vértices similares a Chile:
+grillas densas de concesiones mineras en el norte, multipolígonos enormes de ecosistemas,
+DPA completa por bandas de latitud. No requiere datos reales.
+
+Uso:
+    python benchmarks/generate_dataset.py --output data/bench.sqlite --scale 0.2
+"""
+import argparse
+import math
+import os
+import random
+import sys
+
+import geopandas as gpd
+from shapely.geometry import MultiPolygon, Polygon, box
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BASE_DIR, '..', 'etl')))
+from pipeline_chile import inferir_esquema, guardar_esquema, registrar_capa, registrar_build  # noqa: E402
+
+# Extensión aproximada del territorio continental
+LAT_MIN, LAT_MAX = -55.5, -17.6
+LON_MIN, LON_MAX = -75.5, -67.0
+NORTE = (-28.0, -18.0)  # zona minera densa
+
+# (capa, número de features a escala 1.0)
+TAMANOS = {
+    "concesiones_mineras_const": 60000,
+    "concesiones_mineras_tramite": 30000,
+    "pertenencias_mineras": 500,
+    "concesiones_acuicultura": 3000,
+    "ecmpo": 100,
+    "areas_marinas": 20,
+    "areas_protegidas": 150,
+    "sitios_prioritarios": 300,
+    "ecosistemas": 120,
+}
+
+SITUACIONES = ["Constituida", "En Trámite", "Vigente", "Extinguida"]
+TIPOS_CONCESION = ["Explotación", "Exploración"]
+TITULARES = [f"Minera {chr(65 + i)}{j}" for i in range(26) for j in range(8)]
+FORMACIONES = [f"Bosque {t}" for t in ["caducifolio", "siempreverde", "esclerófilo", "espinoso", "resinoso"]] + \
+              [f"Matorral {t}" for t in ["desértico", "bajo", "arborescente"]] + ["Herbazal de altitud"]
+
+def blob(rng, cx, cy, radio, n_vertices):
+    """Polígono irregular (ruido radial) con n_vertices, como los límites de ecosistemas o áreas protegidas."""
+    puntos = []
+    for i in range(n_vertices):
+        ang = 2 * math.pi * i / n_vertices
+        r = radio * (0.75 + 0.25 * math.sin(ang * 7 + rng.random()) + 0.05 * rng.random())
+        puntos.append((cx + r * math.cos(ang), cy + r * math.sin(ang)))
+    return Polygon(puntos).buffer(0)
+
+def concesiones(rng, n, nombre_base):
+    """Grilla densa de rectángulos (celdas de ~1-3 km) concentrada en el norte, con solapes."""
+    geoms, props = [], []
+    for i in range(n):
+        lat_min, lat_max = NORTE if rng.random() < 0.85 else (LAT_MIN, LAT_MAX)
+        x = rng.uniform(-70.8, -68.2)
+        y = rng.uniform(lat_min, lat_max)
+        w, h = rng.uniform(0.01, 0.03), rng.uniform(0.01, 0.03)
+        geoms.append(box(x, y, x + w, y + h))
+        props.append({
+            "nombre": f"{nombre_base} {i}",
+            "situacion": rng.choice(SITUACIONES),
+            "tipo_conce": rng.choice(TIPOS_CONCESION),
+            "titular_no": rng.choice(TITULARES),
+            "numero_rol": f"0{rng.randint(1000000, 9999999)}",
+            "hectareas": round(w * h * 12000, 2),
+            "fecha_inscripcion": f"{rng.randint(1980, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        })
+    return geoms, props
+
+def poligonos_grandes(rng, n, radio, n_vertices, partes=1):
+    geoms, props = [], []
+    for i in range(n):
+        cx, cy = rng.uniform(LON_MIN + 1, LON_MAX - 1), rng.uniform(LAT_MIN + 1, LAT_MAX - 1)
+        polys = [blob(rng, cx + rng.uniform(-1, 1), cy + rng.uniform(-1, 1), radio, n_vertices) for _ in range(partes)]
+        geoms.append(MultiPolygon([g for p in polys for g in getattr(p, 'geoms', [p])]))
+        props.append({"codigo": i, "piso": f"P{i % 40}", "formacion": rng.choice(FORMACIONES), "nombre": f"Unidad {i}"})
+    return geoms, props
+
+def costeros(rng, n, lon_range, lat_range, tamano):
+    geoms, props = [], []
+    for i in range(n):
+        x, y = rng.uniform(*lon_range), rng.uniform(*lat_range)
+        geoms.append(box(x, y, x + tamano, y + tamano))
+        props.append({"nombre": f"Sitio {i}", "tipo": rng.choice(["A", "B", "C"]), "superficie": round(rng.uniform(1, 500), 1)})
+    return geoms, props
+
+def bandas_dpa(n, columna):
+    """Divide el territorio en n bandas de latitud (regiones, provincias, comunas)."""
+    alto = (LAT_MAX - LAT_MIN) / n
+    geoms, props = [], []
+    for i in range(n):
+        y0 = LAT_MIN + i * alto
+        geoms.append(box(LON_MIN, y0, LON_MAX, y0 + alto))
+        props.append({columna: f"{columna.capitalize()} {i + 1}", "codigo": i + 1})
+    return geoms, props
+
+def capas_sinteticas(rng, scale):
+    n = {k: max(1, int(v * scale)) for k, v in TAMANOS.items()}
+    yield "concesiones_mineras_const", concesiones(rng, n["concesiones_mineras_const"], "Const")
+    yield "concesiones_mineras_tramite", concesiones(rng, n["concesiones_mineras_tramite"], "Tramite")
+    yield "pertenencias_mineras", concesiones(rng, n["pertenencias_mineras"], "Pertenencia")
+    yield "concesiones_acuicultura", costeros(rng, n["concesiones_acuicultura"], (-74.5, -72.5), (-46.0, -41.0), 0.01)
+    yield "ecmpo", costeros(rng, n["ecmpo"], (-75.0, -72.5), (-50.0, -40.0), 0.1)
+    yield "areas_marinas", costeros(rng, n["areas_marinas"], (-75.5, -73.5), (-55.0, -20.0), 0.5)
+    yield "areas_protegidas", poligonos_grandes(rng, n["areas_protegidas"], 0.3, 2000)
+    yield "sitios_prioritarios", poligonos_grandes(rng, n["sitios_prioritarios"], 0.15, 500)
+    yield "ecosistemas", poligonos_grandes(rng, n["ecosistemas"], 1.2, 4000, partes=5)
+    yield "regiones", bandas_dpa(16, "region")
+    yield "provincias", bandas_dpa(56, "provincia")
+    yield "comunas", bandas_dpa(346, "comuna")
+
+def generate(output, scale=1.0, seed=42):
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    if os.path.exists(output):
+        os.remove(output)
+    for name, (geoms, props) in capas_sinteticas(rng, scale):
+        gdf = gpd.GeoDataFrame(props, geometry=geoms, crs="EPSG:4326")
+        gdf, esquema, diccionarios = inferir_esquema(gdf)
+        gdf.to_file(output, driver='SQLite', spatialite=True, layer=name)
+        guardar_esquema(output, name, esquema, diccionarios)
+        registrar_capa(output, name, len(gdf))
+        print(f" -> {name}: {len(gdf)} features")
+    registrar_build(output, db_size_bytes=os.path.getsize(output), etl_version=f"synthetic-scale-{scale}")
+    print(f"DB sintética generada: {output} ({os.path.getsize(output) / 1024 / 1024:.1f} MB)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=os.path.abspath(os.path.join(BASE_DIR, '..', 'data', 'bench.sqlite')))
+    parser.add_argument('--scale', type=float, default=1.0, help="Factor sobre los tamaños de capa (1.0 ~ Chile real)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    generate(args.output, args.scale, args.seed)
@@ -0,0 +1,200 @@
+"""
+Ejecuta escenarios contra el backend en proceso (sin servidor HTTP) sobre una DB sintética
+y reporta throughput y percentiles p50/p95/p99. Con --baseline falla (exit 1) si algún
+escenario empeora más que --tolerance respecto a la línea base guardada.
+
+Uso:
+    python benchmarks/generate_dataset.py --output data/bench.sqlite --scale 0.2
+    python benchmarks/run.py --db data/bench.sqlite --concurrency 8 --requests 200 --save-baseline benchmarks/baseline.json
+    python benchmarks/run.py --db data/bench.sqlite --concurrency 8 --requests 200 --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.abspath(os.path.join(BASE_DIR, '..', 'backend'))
+
+SCENARIOS = ["reporte_predio", "get_tile", "get_feature_info", "upload_predio"]
+
+def fake_request(method="GET"):
+    """Request mínimo para endpoints que negocian compresión."""
+    from starlette.requests import Request
+    return Request({"type": "http", "method": method, "path": "/", "query_string": b"",
+                    "headers": [(b"accept-encoding", b"gzip")]})
+
+def multipart_request(content, filename, boundary="geoportal-bench"):
+    """Request POST multipart con el archivo en el campo 'file', entregado por receive() como un servidor."""
+    from starlette.requests import Request
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8') + content + \
+        f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    headers = [(b"accept-encoding", b"gzip"),
+               (b"content-type", f"multipart/form-data; boundary={boundary}".encode('utf-8')),
+               (b"content-length", str(len(body)).encode('utf-8'))]
+    return Request({"type": "http", "method": "POST", "path": "/api/upload-predio", "query_string": b"",
+                    "headers": headers}, receive)
+
+def random_polygon(rng):
+    # Predios de 1 a ~400 km2 sesgados al norte minero, donde los reportes son más pesados
+    x = rng.uniform(-70.8, -68.5)
+    y = rng.uniform(-28.0, -18.5) if rng.random() < 0.7 else rng.uniform(-45.0, -28.0)
+    w, h = rng.uniform(0.01, 0.2), rng.uniform(0.01, 0.2)
+    return {"type": "Polygon", "coordinates": [[[x, y], [x + w, y], [x + w, y + h], [x, y + h], [x, y]]]}
+
+def deg2tile(lon, lat, z):
+    n = 2 ** z
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return x, y
+
+def make_call(main, scenario, rng):
+    """Devuelve una corrutina que ejecuta una llamada del escenario."""
+    if scenario == "reporte_predio":
+        payload = main.GeoJSONPayload(type="Feature", geometry=random_polygon(rng), properties={})
+        return main.reporte_predio(payload, fake_request("POST"))
+    if scenario == "get_tile":
+        z = rng.randint(8, 12)
+        x, y = deg2tile(rng.uniform(-70.8, -68.5), rng.uniform(-28.0, -18.5), z)
+        layer = rng.choice(["concesiones_mineras_const", "concesiones_mineras_tramite", "ecosistemas"])
+        return main.get_tile(layer, z, x, y, fake_request())
+    if scenario == "get_feature_info":
+        return main.get_feature_info("concesiones_mineras_const", rng.uniform(-28.0, -18.5), rng.uniform(-70.8, -68.5))
+    if scenario == "upload_predio":
+        fc = {"type": "FeatureCollection", "features": [
+            {"type": "Feature", "properties": {"id": i}, "geometry": random_polygon(rng)} for i in range(5)]}
+        return main.upload_predio(multipart_request(json.dumps(fc).encode('utf-8'), "predio.geojson"))
+    raise ValueError(scenario)
+
+def is_error(result):
+    """Los endpoints también fallan sin excepción: Response con status >= 400 o dict con 'error'."""
+    if getattr(result, "status_code", 200) >= 400:
+        return True
+    # "No feature found" es un punto sin features (respuesta normal), no una falla
+    return isinstance(result, dict) and "error" in result and result["error"] != "No feature found"
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(math.ceil(q * len(sorted_values))) - 1))
+    return sorted_values[idx]
+
+async def run_scenario(main, scenario, n_requests, concurrency, seed):
+    if scenario == "get_tile":
+        # Se mide la generación en frío: el LRU de tiles vaciado y sin retener entradas, así
+        # ninguna muestra (ni la línea base) es un hit en memoria
+        main.tile_cache.clear()
+        cache_size, main.tile_cache.max_items = main.tile_cache.max_items, 0
+        try:
+            return await _run_scenario(main, scenario, n_requests, concurrency, seed)
+        finally:
+            main.tile_cache.max_items = cache_size
+    return await _run_scenario(main, scenario, n_requests, concurrency, seed)
+
+async def _run_scenario(main, scenario, n_requests, concurrency, seed):
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                if is_error(await make_call(main, scenario, rng)):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(n_requests)])
+    wall = time.perf_counter() - wall_start
+    latencies.sort()
+    return {
+        "requests": n_requests,
+        "errors": errors,
+        "throughput_rps": round(n_requests / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+def compare(results, baseline, tolerance):
+    """Lista de regresiones: p95 mayor o throughput menor que la línea base más allá de la tolerancia."""
+    regressions = []
+    for scenario, res in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        if res["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {res['p95_ms']} ms > {base['p95_ms']} ms (+{tolerance:.0%})")
+        if res["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {res['throughput_rps']} rps < {base['throughput_rps']} rps (-{tolerance:.0%})")
+        if res["errors"] > base.get("errors", 0):
+            regressions.append(f"{scenario}: {res['errors']} errores (línea base {base.get('errors', 0)})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=os.path.abspath(os.path.join(BASE_DIR, '..', 'data', 'bench.sqlite')))
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=100, help="Llamadas por escenario")
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', help="JSON de línea base contra el cual comparar")
+    parser.add_argument('--save-baseline', help="Guardar los resultados como nueva línea base")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Empeoramiento tolerado (0.2 = 20%%)")
+    parser.add_argument('--output', help="Guardar resultados en JSON")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"No existe {args.db}; generarla con benchmarks/generate_dataset.py")
+    # El backend lee DATABASE_PATH al importarse
+    os.environ['DATABASE_PATH'] = os.path.abspath(args.db)
+    sys.path.insert(0, BACKEND_DIR)
+    import main as backend_main
+
+    results = {}
+    for scenario in [s.strip() for s in args.scenarios.split(',') if s.strip()]:
+        if scenario not in SCENARIOS:
+            sys.exit(f"Escenario desconocido: {scenario}")
+        results[scenario] = asyncio.run(run_scenario(backend_main, scenario, args.requests, args.concurrency, args.seed))
+        r = results[scenario]
+        print(f"{scenario:<18} {r['throughput_rps']:>8} rps  p50 {r['p50_ms']:>9} ms  "
+              f"p95 {r['p95_ms']:>9} ms  p99 {r['p99_ms']:>9} ms  errores {r['errors']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Línea base guardada en {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nREGRESIONES:")
+            for r in regressions:
+                print(f"  - {r}")
+            sys.exit(1)
+        print("\nSin regresiones respecto a la línea base.")
+
+if __name__ == "__main__":
+    main()
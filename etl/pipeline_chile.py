@@ -4,12 +4,232 @@ import os
 import sqlite3
 import json
 import random
+from datetime import datetime, timezone
 from shapely.geometry import Point, Polygon
 
 # Standard script for Chile Territorial ETL
 # Processes layers sequentially to minimize memory footprint on Railway builds
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ETL_VERSION = "v22-typed-schema"
+
+# Inferencia de esquema: columnas de texto con pocos valores distintos se guardan
+# como códigos enteros + tabla diccionario (etl_diccionarios)
+MAX_CATEGORIAS = 255
+MIN_FILAS_CATEGORIA = 100
+MAX_RATIO_CATEGORIA = 0.2
+FORMATOS_FECHA = ['%Y-%m-%d', '%Y/%m/%d', '%d-%m-%Y', '%d/%m/%Y', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S']
+VALORES_NULOS = ['', 'nan', 'NaN', 'None', 'null', 'NULL', '<NA>']
+
+# Particionado opcional de las capas de restricción en shards por banda de latitud
+# (SHARD_MODE=lat_bands). Cada shard es una DB SpatiaLite aparte, listada en <db>.shards.json
+SHARD_MODE = os.environ.get('SHARD_MODE', 'off').lower()
+SHARD_BANDS = [  # (nombre, lat_min, lat_max); las bandas extremas son abiertas para no perder features
+    ("norte", -27.0, 90.0),
+    ("centro", -36.0, -27.0),
+    ("sur", -44.0, -36.0),
+    ("austral", -90.0, -44.0),
+]
+CAPAS_SHARD = ["sitios_prioritarios", "pertenencias_mineras", "concesiones_acuicultura", "ecmpo", "areas_marinas",
+               "areas_protegidas", "ecosistemas", "concesiones_mineras_const", "concesiones_mineras_tramite"]
+
+def fix_encoding(text):
+    """Arregla mojibake Latin-1/UTF-8 ("RegiÃ³n" -> "Región") una sola vez al cargar."""
+    if not isinstance(text, str) or ('Ã' not in text and 'Â' not in text):
+        return text
+    try:
+        return text.encode('latin-1').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return text
+
+def _inferir_fecha(serie):
+    """Devuelve la serie como datetime si todos los valores calzan con un formato conocido."""
+    for formato in FORMATOS_FECHA:
+        convertida = pd.to_datetime(serie, format=formato, errors='coerce')
+        if convertida.notnull().all():
+            return convertida
+    return None
+
+def inferir_esquema(gdf):
+    """
+    Infiere y aplica un tipo por columna. Retorna (gdf, esquema, diccionarios), donde
+    esquema es {columna: tipo} y diccionarios es {columna: [valores]} para categorías
+    (el código guardado en la capa es la posición en la lista).
+    """
+    esquema = {}
+    diccionarios = {}
+    for col in gdf.columns:
+        if col == 'geometry':
+            continue
+        serie = gdf[col]
+
+        if pd.api.types.is_bool_dtype(serie) or pd.api.types.is_integer_dtype(serie):
+            gdf[col] = serie.astype('Int64')
+            esquema[col] = 'integer'
+            continue
+        if pd.api.types.is_float_dtype(serie):
+            no_nulos = serie.dropna()
+            if len(no_nulos) and (no_nulos == no_nulos.round()).all() and no_nulos.abs().max() < 2**53:
+                gdf[col] = serie.round().astype('Int64')
+                esquema[col] = 'integer'
+            else:
+                esquema[col] = 'real'
+            continue
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            esquema[col] = 'datetime'
+            continue
+
+        # Texto: normalizar nulos y encoding antes de intentar tipos más compactos
+        serie = serie.map(lambda v: fix_encoding(v.strip()) if isinstance(v, str) else v)
+        serie = serie.replace(VALORES_NULOS, None)
+        serie = serie.where(serie.notnull(), None).astype(object)
+        no_nulos = serie.dropna().astype(str)
+
+        if no_nulos.empty:
+            gdf[col] = serie
+            esquema[col] = 'text'
+            continue
+
+        # Códigos con ceros a la izquierda ("0123") se mantienen como texto
+        tiene_ceros = no_nulos.str.match(r'^-?0\d').any()
+        numerica = pd.to_numeric(no_nulos, errors='coerce')
+        if not tiene_ceros and numerica.notnull().all():
+            if (numerica == numerica.round()).all():
+                if numerica.abs().max() < 2**53:
+                    gdf[col] = pd.to_numeric(serie, errors='coerce').round().astype('Int64')
+                    esquema[col] = 'integer'
+                else:
+                    # IDs enteros fuera del rango exacto de float: como real se corromperían, quedan como texto
+                    gdf[col] = serie
+                    esquema[col] = 'text'
+            else:
+                gdf[col] = pd.to_numeric(serie, errors='coerce').astype(float)
+                esquema[col] = 'real'
+            continue
+
+        fechas = _inferir_fecha(no_nulos)
+        if fechas is not None:
+            gdf[col] = fechas.reindex(serie.index)
+            esquema[col] = 'datetime'
+            continue
+
+        n_distintos = no_nulos.nunique()
+        if (len(serie) >= MIN_FILAS_CATEGORIA and n_distintos <= MAX_CATEGORIAS
+                and n_distintos <= MAX_RATIO_CATEGORIA * len(serie)):
+            valores = sorted(no_nulos.unique())
+            codigos = {v: i for i, v in enumerate(valores)}
+            gdf[col] = serie.map(lambda v: codigos.get(v) if v is not None else None).astype('Int64')
+            esquema[col] = 'category'
+            diccionarios[col] = valores
+            continue
+
+        gdf[col] = serie
+        esquema[col] = 'text'
+    return gdf, esquema, diccionarios
+
+def registrar_capa(db_path, layer, feature_count):
+    """
+    Registra conteo y tamaño en disco de la capa en etl_layers, para que el health check
+    del backend no tenga que hacer COUNT(*) sobre las tablas.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("""CREATE TABLE IF NOT EXISTS etl_layers (
+            layer TEXT PRIMARY KEY, feature_count INTEGER, size_bytes INTEGER, updated_at TEXT)""")
+        try:
+            # dbstat solo existe si SQLite se compiló con SQLITE_ENABLE_DBSTAT_VTAB
+            size_bytes = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = ?", (layer,)).fetchone()[0]
+        except sqlite3.OperationalError:
+            size_bytes = None
+        conn.execute("INSERT OR REPLACE INTO etl_layers VALUES (?, ?, ?, ?)",
+                     (layer, int(feature_count), size_bytes, datetime.now(timezone.utc).isoformat(timespec='seconds')))
+        conn.commit()
+    finally:
+        conn.close()
+
+def registrar_build(db_path, **info):
+    """Guarda información del build del ETL (fecha, versión, tamaño) en etl_build (clave/valor)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS etl_build (clave TEXT PRIMARY KEY, valor TEXT)")
+        info.setdefault('built_at', datetime.now(timezone.utc).isoformat(timespec='seconds'))
+        info.setdefault('etl_version', ETL_VERSION)
+        conn.executemany("INSERT OR REPLACE INTO etl_build VALUES (?, ?)", [(k, str(v)) for k, v in info.items()])
+        conn.commit()
+    finally:
+        conn.close()
+
+def shard_path(db_path, zona):
+    base, ext = os.path.splitext(db_path)
+    return f"{base}.{zona}{ext}"
+
+def manifest_path(db_path):
+    return f"{os.path.splitext(db_path)[0]}.shards.json"
+
+def exportar_shards(gdf, layer, db_path, esquema, diccionarios):
+    """
+    Escribe la capa en cada shard cuya banda de latitud toque el bbox de la feature: las que cruzan
+    un límite quedan en ambos shards. feature_uid (= ROWID en la DB principal, que se escribe en el
+    mismo orden) permite al backend deduplicar al combinar resultados de varios shards.
+    """
+    gdf = gdf.copy()
+    gdf['feature_uid'] = range(1, len(gdf) + 1)
+    bounds = gdf.geometry.bounds
+    esquema = dict(esquema, feature_uid='integer')
+    for zona, lat_min, lat_max in SHARD_BANDS:
+        subset = gdf[(bounds.maxy >= lat_min) & (bounds.miny <= lat_max)]
+        if subset.empty:
+            continue
+        path = shard_path(db_path, zona)
+        subset.to_file(path, driver='SQLite', spatialite=True, layer=layer)
+        guardar_esquema(path, layer, esquema, diccionarios)
+        registrar_capa(path, layer, len(subset))
+        print(f"    Shard {zona}: {len(subset)} filas")
+
+def escribir_manifest_shards(db_path):
+    """Manifest que el backend usa para enrutar consultas a los shards que tocan cada bbox."""
+    shards = []
+    for zona, lat_min, lat_max in SHARD_BANDS:
+        path = shard_path(db_path, zona)
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(path)
+        try:
+            layers = [row[0] for row in conn.execute("SELECT layer FROM etl_layers")]
+        finally:
+            conn.close()
+        registrar_build(path, db_size_bytes=os.path.getsize(path), shard=zona)
+        shards.append({"name": zona, "lat_min": lat_min, "lat_max": lat_max,
+                       "path": os.path.basename(path), "url": None, "layers": layers})
+    with open(manifest_path(db_path), 'w', encoding='utf-8') as f:
+        json.dump({"mode": SHARD_MODE, "shards": shards}, f, indent=2)
+    print(f" -> Manifest de shards: {manifest_path(db_path)} ({len(shards)} shards)")
+
+def exportar_flatgeobuf(gdf, diccionarios, output_path):
+    """Exporta la capa a FlatGeobuf con SPATIAL_INDEX (las categorías van con su valor, no el código)."""
+    gdf_fgb = gdf[gdf.geometry.notnull() & ~gdf.geometry.is_empty].copy()
+    for col, valores in diccionarios.items():
+        gdf_fgb[col] = gdf_fgb[col].map(dict(enumerate(valores))).astype(object)
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    gdf_fgb.to_file(output_path, driver='FlatGeobuf', SPATIAL_INDEX='YES')
+    del gdf_fgb
+
+def guardar_esquema(db_path, layer, esquema, diccionarios):
+    """Registra el esquema de la capa y sus diccionarios de categorías en la metadata de la DB."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS etl_schema (layer TEXT, columna TEXT, tipo TEXT, PRIMARY KEY (layer, columna))")
+        conn.execute("CREATE TABLE IF NOT EXISTS etl_diccionarios (layer TEXT, columna TEXT, codigo INTEGER, valor TEXT, PRIMARY KEY (layer, columna, codigo))")
+        conn.execute("DELETE FROM etl_schema WHERE layer = ?", (layer,))
+        conn.execute("DELETE FROM etl_diccionarios WHERE layer = ?", (layer,))
+        conn.executemany("INSERT INTO etl_schema VALUES (?, ?, ?)",
+                         [(layer, col, tipo) for col, tipo in esquema.items()])
+        conn.executemany("INSERT INTO etl_diccionarios VALUES (?, ?, ?, ?)",
+                         [(layer, col, i, v) for col, valores in diccionarios.items() for i, v in enumerate(valores)])
+        conn.commit()
+    finally:
+        conn.close()
 
 def process_and_export():
     # Caminno para el log que podremos ver desde la web
@@ -42,12 +262,14 @@ def process_and_export():
     
     # Preparar DB
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    if os.path.exists(db_path):
-        try:
-            os.remove(db_path)
-            print(f"Base de datos anterior eliminada: {db_path}")
-        except Exception as e:
-            print(f"WARN: No se pudo eliminar la DB anterior ({e})")
+    anteriores = [db_path, manifest_path(db_path)] + [shard_path(db_path, zona) for zona, _, _ in SHARD_BANDS]
+    for path in anteriores:
+        if os.path.exists(path):
+            try:
+                os.remove(path)
+                print(f"Base de datos anterior eliminada: {path}")
+            except Exception as e:
+                print(f"WARN: No se pudo eliminar la DB anterior ({e})")
     
     # Lista de capas reales a procesar (Name, Path)
     capas_reales = [
@@ -90,17 +312,18 @@ def process_and_export():
             gdf.geometry = gdf.geometry.buffer(0)
             gdf = gdf[gdf.geometry.is_valid & ~gdf.geometry.is_empty]
 
-            # Limpiar NaNs para evitar errores de exportación ('nan' error)
-            for col in gdf.columns:
-                if col != 'geometry':
-                    # Forzar a string estándar (object) y limpiar NaNs/Nones
-                    gdf[col] = gdf[col].astype(str).replace(['nan', 'None', '<NA>', 'NaN'], '')
-                    gdf[col] = gdf[col].astype(object)
+            # Inferir tipos por columna (enteros, reales, fechas, categorías) en vez de
+            # forzar todo a texto: filas más chicas = menos páginas leídas por consulta
+            gdf, esquema, diccionarios = inferir_esquema(gdf)
+            print(f"    Esquema: {esquema}")
 
-            # Prevenir problemas de tipos antes de exportar
             print(f"    Exportando {len(gdf)} filas...")
 
             gdf.to_file(db_path, driver=driver, spatialite=spatialite, layer=name)
+            guardar_esquema(db_path, name, esquema, diccionarios)
+            registrar_capa(db_path, name, len(gdf))
+            if SHARD_MODE == 'lat_bands' and name in CAPAS_SHARD:
+                exportar_shards(gdf, name, db_path, esquema, diccionarios)
             print(f"    OK")
             
             # EXPORTAR TAMBIÉN A GEOJSON PARA EL MAPA (solo si es necesario para el frontend)
@@ -127,6 +350,11 @@ def process_and_export():
                 gdf_simple[['geometry']].to_file(json_output, driver='GeoJSON')
                 print(f"    JSON del mapa OK (Ultra-Optimizado V20)")
                 del gdf_simple
+
+                # 4. FlatGeobuf con índice espacial (R-tree Hilbert empaquetado) y atributos completos:
+                # permite leer solo las features de un bbox vía HTTP Range sin pasar por SpatiaLite
+                exportar_flatgeobuf(gdf, diccionarios, os.path.join(map_data_dir, f"{name}.fgb"))
+                print(f"    FlatGeobuf OK")
             
             del gdf # IMPORTANTE: Liberar memoria
         except Exception as e:
@@ -158,16 +386,20 @@ def process_and_export():
     
     for name, data in mock_layers_data:
         gdf_mock = gpd.GeoDataFrame(data, crs=crs)
-        # Prevenir problemas de tipos en mocks
-        for col in gdf_mock.columns:
-            if col != 'geometry':
-                gdf_mock[col] = gdf_mock[col].astype(object)
+        gdf_mock, esquema, diccionarios = inferir_esquema(gdf_mock)
         gdf_mock.to_file(db_path, driver=driver, spatialite=spatialite, layer=name)
+        guardar_esquema(db_path, name, esquema, diccionarios)
+        registrar_capa(db_path, name, len(gdf_mock))
+        if SHARD_MODE == 'lat_bands' and name in CAPAS_SHARD:
+            exportar_shards(gdf_mock, name, db_path, esquema, diccionarios)
         print(f" -> Mock {name} OK")
         del gdf_mock
 
     # Finalizar
     if os.path.exists(db_path):
+        registrar_build(db_path, db_size_bytes=os.path.getsize(db_path))
+        if SHARD_MODE == 'lat_bands':
+            escribir_manifest_shards(db_path)
         size_mb = os.path.getsize(db_path) / 1024 / 1024
         print(f"\nDB generada exitosamente: {db_path} ({size_mb:.1f} MB)")
         
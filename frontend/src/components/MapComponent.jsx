@@ -24,12 +24,37 @@ if (!protocolAdded) {
     });
 }
 
+// Mining layers are fetched per viewport from /api/features instead of whole static files
+const VIEWPORT_LAYERS = ['concesiones_mineras_const', 'concesiones_mineras_tramite'];
+// Below this zoom the view covers whole regions of the mining grid: nothing is fetched and the user is asked to zoom in
+const VIEWPORT_MIN_ZOOM = 9;
+// Safety cap: pages are followed until next_cursor is null, but never past this many features (shown as truncated)
+const VIEWPORT_MAX_FEATURES = 50000;
+
+async function fetchViewportFeatures(layer, bounds, zoom, signal) {
+    const bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].map(v => v.toFixed(5)).join(',');
+    const features = [];
+    let cursor = 0;
+    while (cursor !== null && features.length < VIEWPORT_MAX_FEATURES) {
+        const res = await fetch(`/api/features/${layer}?bbox=${bbox}&z=${Math.floor(zoom)}&cursor=${cursor}`, { signal });
+        if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
+        const data = await res.json();
+        features.push(...data.features);
+        cursor = data.next_cursor;
+    }
+    return { fc: { type: 'FeatureCollection', features }, truncated: cursor !== null };
+}
+
+const EMPTY_FC = { type: 'FeatureCollection', features: [] };
 
 const MapComponent = forwardRef(({ onAnalyzePolygon, isAnalyzing, activeLayers, mapStyle, results, onMapReady }, ref) => {
     const mapContainer = useRef(null);
     const map = useRef(null);
     const draw = useRef(null);
     const [mapLoaded, setMapLoaded] = React.useState(false);
+    const viewportLoader = useRef(null);
+    // Per viewport layer: 'zoom' (below VIEWPORT_MIN_ZOOM) or 'truncated' (hit VIEWPORT_MAX_FEATURES)
+    const [viewportStatus, setViewportStatus] = React.useState({});
 
     useImperativeHandle(ref, () => ({
         clearDrawings() {
@@ -117,11 +142,11 @@ const MapComponent = forwardRef(({ onAnalyzePolygon, isAnalyzing, activeLayers,
                     },
                     'concesiones_mineras_const': {
                         type: 'geojson',
-                        data: `/data/concesiones_mineras_const.json`
+                        data: { type: 'FeatureCollection', features: [] }
                     },
                     'concesiones_mineras_tramite': {
                         type: 'geojson',
-                        data: `/data/concesiones_mineras_tramite.json`
+                        data: { type: 'FeatureCollection', features: [] }
                     }
                 },
                 layers: [
@@ -341,6 +366,37 @@ const MapComponent = forwardRef(({ onAnalyzePolygon, isAnalyzing, activeLayers,
             });
         });
 
+        // Load visible mining layers for the current viewport only (bbox + zoom simplification)
+        let viewportAbort = null;
+        viewportLoader.current = () => {
+            if (viewportAbort) viewportAbort.abort();
+            viewportAbort = new AbortController();
+            const bounds = map.current.getBounds();
+            const zoom = map.current.getZoom();
+            VIEWPORT_LAYERS.forEach(layer => {
+                const setStatus = status => setViewportStatus(prev => ({ ...prev, [layer]: status }));
+                if (map.current.getLayoutProperty(`${layer}-fill`, 'visibility') !== 'visible') {
+                    setStatus(null);
+                    return;
+                }
+                if (zoom < VIEWPORT_MIN_ZOOM) {
+                    map.current.getSource(layer)?.setData(EMPTY_FC);
+                    setStatus('zoom');
+                    return;
+                }
+                fetchViewportFeatures(layer, bounds, zoom, viewportAbort.signal)
+                    .then(({ fc, truncated }) => {
+                        map.current.getSource(layer)?.setData(fc);
+                        setStatus(truncated ? 'truncated' : null);
+                    })
+                    .catch(err => {
+                        if (err.name !== 'AbortError') console.error(`Error loading ${layer}:`, err);
+                    });
+            });
+        };
+        map.current.on('load', () => viewportLoader.current());
+        map.current.on('moveend', () => viewportLoader.current());
+
         // Add popups for map features
         const clickableLayers = [
             'areas_protegidas-fill', 'sitios_prioritarios-fill', 'ecosistemas-fill',
@@ -571,6 +627,9 @@ const MapComponent = forwardRef(({ onAnalyzePolygon, isAnalyzing, activeLayers,
             }
         });
 
+        // Newly enabled viewport layers need their features for the current view
+        if (viewportLoader.current && map.current.loaded()) viewportLoader.current();
+
         // Hide or show mapbox draw layers based on 'terrenos' state
         const style = map.current.getStyle();
         if (style && style.layers) {
@@ -609,6 +668,13 @@ const MapComponent = forwardRef(({ onAnalyzePolygon, isAnalyzing, activeLayers,
                     </div>
                 </div>
             )}
+            {Object.values(viewportStatus).some(Boolean) && (
+                <div className="absolute top-3 left-1/2 -translate-x-1/2 z-[900] bg-slate-900/90 text-white text-sm px-4 py-2 rounded-lg shadow-lg border border-slate-700">
+                    {Object.values(viewportStatus).includes('zoom')
+                        ? 'Acerque el mapa para ver las concesiones mineras.'
+                        : `Vista parcial: se muestran las primeras ${VIEWPORT_MAX_FEATURES.toLocaleString('es-CL')} concesiones mineras. Acerque el mapa para verlas todas.`}
+                </div>
+            )}
         </div>
     );
 });
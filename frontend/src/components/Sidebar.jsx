@@ -137,7 +137,7 @@ const Sidebar = ({ isAnalyzing, results, showResultsPanel, setShowResultsPanel,
             {/* HERRAMIENTAS - Moved to Top without Title */}
             <div>
                 <p className="text-xs text-slate-400 mb-4 leading-relaxed bg-slate-800/30 p-2.5 rounded border border-slate-800/80">
-                    💡 Sube el polígono de tu terreno en un archivo espacial (.geojson, .kml, shapefiles en .zip) o dibújalo. Haz <strong>doble clic</strong> para terminar el dibujo.
+                    💡 Sube el polígono de tu terreno en un archivo espacial (.geojson, .kml, .kmz, shapefiles en .zip) o dibújalo. Haz <strong>doble clic</strong> para terminar el dibujo.
                 </p>
 
                 <div className="grid grid-cols-2 gap-2 mb-4">
@@ -151,7 +151,7 @@ const Sidebar = ({ isAnalyzing, results, showResultsPanel, setShowResultsPanel,
                     </button>
 
                     <div className="relative">
-                        <input type="file" id="file-upload" className="hidden" accept=".geojson,.json,.kml,.zip" onChange={onFileUpload} />
+                        <input type="file" id="file-upload" className="hidden" accept=".geojson,.json,.kml,.kmz,.zip" onChange={onFileUpload} />
                         <label htmlFor="file-upload" className="w-full h-full bg-slate-800 hover:bg-blue-600 text-slate-300 hover:text-white cursor-pointer font-medium py-3 px-2 rounded-lg transition-colors flex flex-col items-center justify-center gap-1 border border-slate-700 hover:border-blue-500 group">
                             <Upload className="w-5 h-5 group-hover:scale-110 transition-transform" />
                             <span className="text-[10px] uppercase tracking-wider font-semibold text-center leading-tight">Subir Archivo<br />Espacial</span>